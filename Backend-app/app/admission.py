@@ -0,0 +1,198 @@
+import asyncio
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request, status
+from app.cpu import available_cpus
+
+# --- Concurrency limits per route class ---
+# Each class admits `limit` requests at once and lets up to `queue_size` more wait for
+# at most `timeout` seconds. Anything beyond that is turned away at once with a 503, so a
+# login flood cannot take the CPU that product reads need. A limit of 0 disables the class.
+ADMISSION_AUTH_CONCURRENCY = int(os.getenv("ADMISSION_AUTH_CONCURRENCY", str(available_cpus() * 2)))
+ADMISSION_AUTH_QUEUE = int(os.getenv("ADMISSION_AUTH_QUEUE", "16"))
+ADMISSION_AUTH_TIMEOUT = float(os.getenv("ADMISSION_AUTH_TIMEOUT", "2"))  # Seconds a request may wait
+# Image uploads stream in chunks, so this bounds the memory all uploads together can use.
+ADMISSION_UPLOAD_CONCURRENCY = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "16"))
+ADMISSION_UPLOAD_QUEUE = int(os.getenv("ADMISSION_UPLOAD_QUEUE", "32"))
+ADMISSION_UPLOAD_TIMEOUT = float(os.getenv("ADMISSION_UPLOAD_TIMEOUT", "5"))
+
+# Raised when a route class is at its limit and its wait queue is full or the wait timed out.
+class Overloaded(Exception):
+    pass
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, queue_size: int, timeout: float):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            # Created lazily so it binds to the running event loop.
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                raise Overloaded()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded()
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "rejected": self.rejected}
+
+limiters = {
+    "auth": ConcurrencyLimiter(ADMISSION_AUTH_CONCURRENCY, ADMISSION_AUTH_QUEUE, ADMISSION_AUTH_TIMEOUT),
+    "upload": ConcurrencyLimiter(ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_QUEUE, ADMISSION_UPLOAD_TIMEOUT),
+}
+
+# Returned when a route class, the hashing queue or the image queue is full, so clients
+# back off for retry_after seconds instead of piling up.
+def server_busy(retry_after: int = 1):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please retry",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+# Returns a dependency that holds a slot of the route class for the whole request.
+def limit_concurrency(route_class: str):
+    async def dependency():
+        limiter = limiters[route_class]
+        if limiter.limit <= 0:
+            yield
+            return
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            raise server_busy()
+        try:
+            yield
+        finally:
+            limiter.release()
+    return dependency
+
+# --- Client addresses ---
+# Behind the ingress or load balancer every connection comes from a proxy, so the client is
+# the rightmost X-Forwarded-For address that is not a trusted proxy. FORWARDED_ALLOW_IPS
+# lists the trusted proxies as addresses or CIDR ranges, e.g. the load balancer subnets
+# "10.0.0.0/16"; it is the same variable gunicorn and uvicorn read, and uvicorn only
+# understands exact addresses, so ranges are resolved here. "*" trusts any direct peer (for
+# pods only the load balancer can reach) and takes the address it appended.
+FORWARDED_ALLOW_IPS = [item.strip() for item in os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1").split(",") if item.strip()]
+
+def _parse_networks(items):
+    networks = []
+    for item in items:
+        if item == "*":
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            print(f"Ignoring FORWARDED_ALLOW_IPS entry {item!r}: not an address or CIDR range")
+    return networks
+
+TRUST_ALL_PROXIES = "*" in FORWARDED_ALLOW_IPS
+TRUSTED_PROXIES = _parse_networks(FORWARDED_ALLOW_IPS)
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+# The address of the client behind any trusted proxies.
+def client_address(request: Request) -> str:
+    if request.client is None:
+        return "unknown"
+    peer = request.client.host
+    if not TRUST_ALL_PROXIES and not is_trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+# --- Login rate limits ---
+# Token buckets per client address and per target email from that address. A bucket holds
+# up to `per_minute` attempts and refills at per_minute / 60 per second; 0 disables that
+# limit. The email bucket is per client, so nobody can lock a user out by guessing at
+# their account; guessing from many addresses still meets the per-address limit.
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "30"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "10"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Interface for token bucket backends. A shared store (e.g. Redis) can replace the
+# in-memory backend by implementing take() and calling set_rate_limit_backend(), so
+# limits hold across pods.
+class RateLimitBackend:
+    # Takes one token from the bucket. Returns 0 if allowed, else seconds until a token is free.
+    def take(self, key: str, per_minute: float) -> float:
+        raise NotImplementedError
+
+# In-process token buckets, least recently used keys are dropped past max_keys.
+class MemoryRateLimit(RateLimitBackend):
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, per_minute: float) -> float:
+        rate = per_minute / 60
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (per_minute, now))
+            tokens = min(per_minute, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+rate_limit_backend: RateLimitBackend = MemoryRateLimit()
+
+# Replaces the rate limit backend, e.g. with a shared store.
+def set_rate_limit_backend(backend: RateLimitBackend):
+    global rate_limit_backend
+    rate_limit_backend = backend
+
+# Rejects a login attempt with 429 once the client, or the client's attempts at the target
+# account, are out of tokens.
+def check_login_rate(request: Request, email: str):
+    client = client_address(request)
+    limits = ((f"login:ip:{client}", LOGIN_IP_PER_MINUTE), (f"login:email:{email.lower()}:{client}", LOGIN_EMAIL_PER_MINUTE))
+    for key, per_minute in limits:
+        if per_minute <= 0:
+            continue
+        retry_after = rate_limit_backend.take(key, per_minute)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please retry later",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
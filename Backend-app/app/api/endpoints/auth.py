@@ -1,28 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app import schemas, crud, models
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app import admission, schemas, crud, models, export
+from app.db import get_db, get_async_db
+from app.replicas import get_read_engine
 from app.auth import auth
-from jose import JWTError, jwt
 
 # Create an API router for the authentication endpoints.
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 # Endpoint for user registration.
-@router.post("/register", response_model=schemas.UserResponse)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+# Hashing runs on the hashing executor so it never holds a request thread.
+# The insert itself rejects an existing email, so registering is a single statement.
+@router.post("/register", response_model=schemas.UserResponse, dependencies=[Depends(admission.limit_concurrency("auth"))])
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    try:
+        hashed_password = await auth.hash_password_async(user.password)
+    except auth.HashingQueueFull:
+        raise admission.server_busy()
+    db_user = await run_in_threadpool(crud.create_user, db, user, hashed_password)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return db_user
 
 # Endpoint for user login and token generation.
-@router.post("/login", response_model=schemas.Token)
-def login_for_access_token(user: schemas.TokenRequest, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if not db_user or not auth.verify_password(user.password, db_user.hashed_password):
+# Attempts are rate limited per client and per account, and share the auth concurrency limit.
+@router.post("/login", response_model=schemas.Token, dependencies=[Depends(admission.limit_concurrency("auth"))])
+async def login_for_access_token(request: Request, user: schemas.TokenRequest, db: Session = Depends(get_db)):
+    admission.check_login_rate(request, user.email)
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
+    verified, new_hash = False, None
+    try:
+        if db_user is not None:
+            verified, new_hash = await auth.verify_and_update_async(user.password, db_user.hashed_password)
+    except auth.HashingQueueFull:
+        raise admission.server_busy()
+    if verified and new_hash:
+        # Stored at another bcrypt cost; keep the rehash so the next login is at the current cost.
+        await run_in_threadpool(crud.update_password_hash, db, db_user, new_hash)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -35,20 +56,60 @@ def login_for_access_token(user: schemas.TokenRequest, db: Session = Depends(get
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Dependency to get the current authenticated user.
+# Verified tokens are served from the token cache without a DB round trip.
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    cached = auth.get_cached_token(token)
+    if cached is not None:
+        return cached[1]
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    payload = auth.decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
+    email: str = payload.get("sub")
+    if email is None:
         raise credentials_exception
     user = crud.get_user_by_email(db, email=email)
     if user is None:
         raise credentials_exception
-    return user
+    return auth.cache_token(token, payload, user)
+
+# Async variant of get_current_user for the ASYNC_DB product endpoints.
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    cached = auth.get_cached_token(token)
+    if cached is not None:
+        return cached[1]
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = auth.decode_access_token(token)
+    if payload is None:
+        raise credentials_exception
+    email: str = payload.get("sub")
+    if email is None:
+        raise credentials_exception
+    user = await crud.get_user_by_email_async(db, email=email)
+    if user is None:
+        raise credentials_exception
+    return auth.cache_token(token, payload, user)
+
+# Dependency for admin endpoints: the current user, when their email is in ADMIN_EMAILS.
+def get_current_admin(current_user: models.User = Depends(get_current_user)):
+    if not auth.is_admin(current_user.email):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+# EXPORT all users (id and email, never password hashes) as NDJSON or CSV (admins only).
+# Rows stream from a server-side cursor on their own connection, like the product export.
+@router.get("/users/export")
+def export_users(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), current_user: models.User = Depends(get_current_admin)):
+    return StreamingResponse(
+        export.iter_export(get_read_engine(), "users", format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
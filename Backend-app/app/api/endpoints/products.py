@@ -1,35 +1,207 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.orm import Session
-from typing import List
-from app import schemas, crud, models
-from app.database import get_db
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Union
+from app import schemas, crud, models, cache, admission, export, feed, images, search, stats
+from app.responses import FastJSONResponse
+from app.replicas import get_read_db, get_write_db, get_read_engine
 from app.api.endpoints.auth import get_current_user
 
 # Create an API router for the product endpoints.
 router = APIRouter()
 
 # GET all products (public access).
-@router.get("/", response_model=List[schemas.ProductResponse])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = crud.get_products(db, skip=skip, limit=limit)
-    return products
+# Passing `after` (empty for the first page) switches to keyset pagination,
+# which returns {"items", "next_cursor"}. Without it the offset listing is unchanged.
+# Rows are already in response shape, so they are encoded directly rather than revalidated.
+@router.get("/", response_model=Union[List[schemas.ProductResponse], schemas.ProductPage])
+def read_products(request: Request, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=crud.MAX_PAGE_SIZE), after: Optional[str] = None, db: Session = Depends(get_read_db)):
+    etag = cache.catalogue_etag(db)
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    headers = {"ETag": etag} if etag else {}
+    if after is not None:
+        try:
+            page = crud.get_products_after_cached(db, after=after, limit=limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return FastJSONResponse(page, headers=headers)
+    return FastJSONResponse(crud.get_products_cached(db, skip=skip, limit=limit), headers=headers)
+
+# --- Bulk endpoints ---
+# Bodies are a JSON array, or NDJSON (one item per line) with Content-Type
+# application/x-ndjson, which is written chunk by chunk as it streams in.
+# Each chunk commits on its own, so the product_stats and product_feed row locks every
+# product write takes are held for one chunk's statements (BULK_CHUNK_SIZE rows), never
+# while waiting on a slow upload. If the upload fails partway, the chunks already
+# committed stay. Rejected items, including NDJSON lines that are not valid JSON, are
+# reported by input index.
+
+# Yields chunks of (index, item) from a bulk body, collecting validation errors.
+async def read_bulk_items(request: Request, validate, errors: list):
+    if "ndjson" in request.headers.get("content-type", ""):
+        raw_items = _ndjson_items(request)
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        raw_items = _list_items(body)
+    chunk = []
+    index = 0
+    async for raw in raw_items:
+        if isinstance(raw, MalformedLine):
+            errors.append({"index": index, "detail": f"Invalid JSON: {raw.error}"})
+            index += 1
+            continue
+        try:
+            chunk.append((index, validate(raw)))
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+            errors.append({"index": index, "detail": detail})
+        index += 1
+        if len(chunk) >= crud.BULK_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+async def _list_items(items):
+    for item in items:
+        yield item
+
+# An NDJSON line that is not valid JSON; reported as that item's error.
+class MalformedLine:
+    def __init__(self, error: ValueError):
+        self.error = error
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return MalformedLine(e)
+
+async def _ndjson_items(request: Request):
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+# Writes and commits a chunk. Returns (written, errors) like the crud chunk writers.
+def _commit_chunk(db: Session, write_chunk, chunk):
+    written, chunk_errors = write_chunk(db, chunk)
+    db.commit()
+    return written, chunk_errors
+
+# Runs write_chunk over every chunk of the body, committing each one.
+async def run_bulk(request: Request, db: Session, validate, write_chunk):
+    ids, errors = [], []
+    try:
+        async for chunk in read_bulk_items(request, validate, errors):
+            written, chunk_errors = await run_in_threadpool(_commit_chunk, db, write_chunk, chunk)
+            ids += [product_id for _, product_id in written]
+            errors += [{"index": index, "detail": detail} for index, detail in chunk_errors]
+            if written:
+                cache.catalogue_changed()
+                feed.notify()
+    except Exception:
+        await run_in_threadpool(db.rollback)
+        raise
+    errors.sort(key=lambda error: error["index"])
+    return {"ids": ids, "errors": errors}
+
+product_id_adapter = TypeAdapter(int)
+
+# CREATE products in bulk (requires authentication).
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def create_products_bulk(request: Request, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
+    return await run_bulk(request, db, schemas.ProductCreate.model_validate, crud.create_products_chunk)
+
+# UPDATE products in bulk; each item carries its id (requires authentication).
+@router.put("/bulk", response_model=schemas.BulkResult)
+async def update_products_bulk(request: Request, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
+    return await run_bulk(request, db, schemas.ProductBulkUpdate.model_validate, crud.update_products_chunk)
+
+# DELETE products in bulk; the body lists product ids (requires authentication).
+@router.post("/bulk/delete", response_model=schemas.BulkResult)
+async def delete_products_bulk(request: Request, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
+    return await run_bulk(request, db, product_id_adapter.validate_python, crud.delete_products_chunk)
+
+# A page of search results in response shape, with prices as exact strings.
+def search_page(items, next_cursor) -> dict:
+    return {"items": [{**item, "price": str(item["price"]) if item["price"] is not None else None} for item in items], "next_cursor": next_cursor}
+
+# SEARCH products by name and description, most relevant first (public access).
+# Tolerates typos in names on Postgres; pages with the returned next_cursor.
+@router.get("/search", response_model=schemas.ProductSearchPage)
+def search_products(q: str = Query(..., min_length=1, max_length=200), after: str = "", limit: int = Query(20, ge=1, le=crud.MAX_PAGE_SIZE), db: Session = Depends(get_read_db)):
+    def load():
+        return search_page(*search.search_products(db, q, after=after, limit=limit))
+    try:
+        return FastJSONResponse(cache.get_or_load(db, f"search:{q}:{after}:{limit}", load))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# EXPORT the whole catalogue as NDJSON or CSV (requires authentication).
+# Rows stream from a server-side cursor on their own connection, so memory stays flat.
+@router.get("/export")
+def export_products(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), current_user: models.User = Depends(get_current_user)):
+    return StreamingResponse(
+        export.iter_export(get_read_engine(), "products", format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+# Catalogue STATS: product count and min/max/avg price (public access).
+# Read from a summary the database keeps current on every write, so the cost does not grow
+# with the catalogue. buckets=true adds a price histogram.
+@router.get("/stats", response_model=schemas.ProductStats)
+def read_product_stats(buckets: bool = False, db: Session = Depends(get_read_db)):
+    result = cache.get_or_load(db, f"stats:{buckets}", lambda: stats.get_stats(db, buckets=buckets))
+    if result is None:
+        raise HTTPException(status_code=503, detail="Catalogue statistics have not been built yet")
+    return result
+
+# Product CHANGE FEED (public access): Server-Sent Events for every create, update and delete,
+# so clients hold one idle connection instead of polling. Reconnecting with Last-Event-ID
+# (or ?since=<version>) resumes where the client left off. See app/feed.py.
+@router.get("/changes")
+async def product_changes(request: Request, since: Optional[int] = None):
+    return await feed.changes_response(request, since)
 
 # GET a single product by ID (public access).
 @router.get("/{product_id}", response_model=schemas.ProductResponse)
-def read_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = crud.get_product(db, product_id=product_id)
+def read_product(product_id: int, request: Request, response: Response, db: Session = Depends(get_read_db)):
+    etag = cache.catalogue_etag(db)
+    # The ETag covers the whole catalogue, so confirm the product exists before a 304.
+    # Known products come from the cache, so this usually sends no query.
+    db_product = crud.get_product_cached(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
     return db_product
 
 # CREATE a new product (requires authentication).
 @router.post("/", response_model=schemas.ProductResponse, status_code=status.HTTP_201_CREATED)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_product(product: schemas.ProductCreate, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
     return crud.create_product(db=db, product=product)
 
 # UPDATE an existing product (requires authentication).
 @router.put("/{product_id}", response_model=schemas.ProductResponse)
-def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
     updated_product = crud.update_product(db, product_id, product)
     if not updated_product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -37,16 +209,29 @@ def update_product(product_id: int, product: schemas.ProductCreate, db: Session
 
 # DELETE a product (requires authentication).
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product(product_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_product(product_id: int, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
     deleted = crud.delete_product(db, product_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "Product deleted successfully"}
 
+# UPLOAD a product image (requires authentication).
+# The raw body (Content-Type image/jpeg, png, webp or gif) streams to the object store chunk
+# by chunk. Resized WebP variants are built in the background; image_url and image_variants
+# change once they are stored.
+@router.put("/{product_id}/image", response_model=schemas.ImageUpload, status_code=status.HTTP_202_ACCEPTED,
+            dependencies=[Depends(admission.limit_concurrency("upload"))])
+async def upload_product_image(product_id: int, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_write_db), current_user: models.User = Depends(get_current_user)):
+    found = await run_in_threadpool(crud.get_product, db, product_id) is not None
+    # Hand the connection back before the body streams in, so slow uploads do not hold the pool.
+    await run_in_threadpool(db.rollback)
+    if not found:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return await images.accept_upload(request, product_id, background_tasks)
+
 # File: app/main.py
 from fastapi import FastAPI
-from sqlalchemy import text
-from app.database import engine, Base, get_db
+from app import migrations
 from app.api.endpoints import auth, products
 
 # Create the FastAPI application instance.
@@ -60,22 +245,14 @@ app = FastAPI(
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(products.router, prefix="/api/products", tags=["Products"])
 
-# Event handler to create database tables when the application starts.
+# Event handler to check the database schema when the application starts.
+# Existing tables and data are never dropped; see app/migrations.py.
 @app.on_event("startup")
 def on_startup():
-    print("Creating database tables...")
     try:
-        # Check for existing tables and drop them to start fresh.
-        with engine.begin() as conn:
-            # We will use this check to see if the table exists before dropping.
-            # In production, you would use Alembic for migrations.
-            conn.execute(text("DROP TABLE IF EXISTS products;"))
-            conn.execute(text("DROP TABLE IF EXISTS users;"))
-        # Create all tables defined in models.py.
-        Base.metadata.create_all(bind=engine)
-        print("Database tables created successfully.")
+        print(f"Database schema {migrations.ensure_schema()}.")
     except Exception as e:
-        print(f"An error occurred during database table creation: {e}")
+        print(f"An error occurred during the database schema check: {e}")
 
 # Root endpoint.
 @app.get("/")
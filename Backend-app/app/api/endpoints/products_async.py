@@ -0,0 +1,142 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+from app import schemas, crud, models, cache, admission, export, feed, images, search, stats
+from app.responses import FastJSONResponse
+from app.replicas import get_async_read_db, get_async_write_db, get_read_engine
+from app.api.endpoints import products
+from app.api.endpoints.auth import get_current_user_async
+
+# Async product endpoints, mounted instead of products.router when ASYNC_DB is enabled.
+# Handlers await the database on the event loop instead of holding a threadpool thread.
+router = APIRouter()
+
+# GET all products (public access). Passing `after` switches to keyset pagination.
+# Rows are already in response shape, so they are encoded directly rather than revalidated.
+@router.get("/", response_model=Union[List[schemas.ProductResponse], schemas.ProductPage])
+async def read_products(request: Request, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=crud.MAX_PAGE_SIZE), after: Optional[str] = None, db: AsyncSession = Depends(get_async_read_db)):
+    etag = await cache.catalogue_etag_async(db)
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    headers = {"ETag": etag} if etag else {}
+    if after is not None:
+        try:
+            page = await crud.get_products_after_cached_async(db, after=after, limit=limit)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return FastJSONResponse(page, headers=headers)
+    return FastJSONResponse(await crud.get_products_cached_async(db, skip=skip, limit=limit), headers=headers)
+
+# Runs write_chunk over every chunk of a bulk body, committing each one. See products.run_bulk;
+# the chunk writers run on the async session through run_sync.
+async def run_bulk(request: Request, db: AsyncSession, validate, write_chunk):
+    ids, errors = [], []
+    try:
+        async for chunk in products.read_bulk_items(request, validate, errors):
+            written, chunk_errors = await db.run_sync(write_chunk, chunk)
+            await db.commit()
+            ids += [product_id for _, product_id in written]
+            errors += [{"index": index, "detail": detail} for index, detail in chunk_errors]
+            if written:
+                cache.catalogue_changed()
+                feed.notify()
+    except Exception:
+        await db.rollback()
+        raise
+    errors.sort(key=lambda error: error["index"])
+    return {"ids": ids, "errors": errors}
+
+# CREATE products in bulk (requires authentication).
+@router.post("/bulk", response_model=schemas.BulkResult)
+async def create_products_bulk(request: Request, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    return await run_bulk(request, db, schemas.ProductCreate.model_validate, crud.create_products_chunk)
+
+# UPDATE products in bulk; each item carries its id (requires authentication).
+@router.put("/bulk", response_model=schemas.BulkResult)
+async def update_products_bulk(request: Request, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    return await run_bulk(request, db, schemas.ProductBulkUpdate.model_validate, crud.update_products_chunk)
+
+# DELETE products in bulk; the body lists product ids (requires authentication).
+@router.post("/bulk/delete", response_model=schemas.BulkResult)
+async def delete_products_bulk(request: Request, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    return await run_bulk(request, db, products.product_id_adapter.validate_python, crud.delete_products_chunk)
+
+# SEARCH products (public access). See products.search_products.
+@router.get("/search", response_model=schemas.ProductSearchPage)
+async def search_products(q: str = Query(..., min_length=1, max_length=200), after: str = "", limit: int = Query(20, ge=1, le=crud.MAX_PAGE_SIZE), db: AsyncSession = Depends(get_async_read_db)):
+    async def load():
+        return products.search_page(*await db.run_sync(search.search_products, q, after=after, limit=limit))
+    try:
+        return FastJSONResponse(await cache.get_or_load_async(db, f"search:{q}:{after}:{limit}", load))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# EXPORT the whole catalogue as NDJSON or CSV (requires authentication). See products.export_products;
+# rows stream from a server-side cursor on the sync engine, iterated off the event loop.
+@router.get("/export")
+async def export_products(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), current_user: models.User = Depends(get_current_user_async)):
+    return StreamingResponse(
+        export.iter_export(get_read_engine(), "products", format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'},
+    )
+
+# Catalogue STATS (public access). See products.read_product_stats.
+@router.get("/stats", response_model=schemas.ProductStats)
+async def read_product_stats(buckets: bool = False, db: AsyncSession = Depends(get_async_read_db)):
+    result = await cache.get_or_load_async(db, f"stats:{buckets}", lambda: db.run_sync(stats.get_stats, buckets=buckets))
+    if result is None:
+        raise HTTPException(status_code=503, detail="Catalogue statistics have not been built yet")
+    return result
+
+# Product CHANGE FEED (public access). See products.product_changes.
+@router.get("/changes")
+async def product_changes(request: Request, since: Optional[int] = None):
+    return await feed.changes_response(request, since)
+
+# GET a single product by ID (public access).
+@router.get("/{product_id}", response_model=schemas.ProductResponse)
+async def read_product(product_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_read_db)):
+    etag = await cache.catalogue_etag_async(db)
+    # The ETag covers the whole catalogue, so confirm the product exists before a 304.
+    # Known products come from the cache, so this usually sends no query.
+    db_product = await crud.get_product_cached_async(db, product_id=product_id)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    if etag:
+        response.headers["ETag"] = etag
+    return db_product
+
+# CREATE a new product (requires authentication).
+@router.post("/", response_model=schemas.ProductResponse, status_code=status.HTTP_201_CREATED)
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    return await crud.create_product_async(db=db, product=product)
+
+# UPDATE an existing product (requires authentication).
+@router.put("/{product_id}", response_model=schemas.ProductResponse)
+async def update_product(product_id: int, product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    updated_product = await crud.update_product_async(db, product_id, product)
+    if not updated_product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return updated_product
+
+# DELETE a product (requires authentication).
+@router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    deleted = await crud.delete_product_async(db, product_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+# UPLOAD a product image (requires authentication). See products.upload_product_image.
+@router.put("/{product_id}/image", response_model=schemas.ImageUpload, status_code=status.HTTP_202_ACCEPTED,
+            dependencies=[Depends(admission.limit_concurrency("upload"))])
+async def upload_product_image(product_id: int, request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_write_db), current_user: models.User = Depends(get_current_user_async)):
+    found = await crud.get_product_async(db, product_id) is not None
+    # Hand the connection back before the body streams in, so slow uploads do not hold the pool.
+    await db.rollback()
+    if not found:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return await images.accept_upload(request, product_id, background_tasks)
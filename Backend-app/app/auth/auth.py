@@ -1,9 +1,16 @@
 import os
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from dotenv import load_dotenv
+from app import metrics, schemas
+from app.cache import MemoryCache
+from app.cpu import available_cpus
 
 # Load environment variables.
 load_dotenv()
@@ -12,17 +19,149 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Comma-separated emails of the users allowed on admin endpoints, such as the user export.
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+# Whether a user may use the admin endpoints.
+def is_admin(email: str) -> bool:
+    return email.lower() in ADMIN_EMAILS
 
 # Password hashing configuration.
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# BCRYPT_ROUNDS is the bcrypt cost factor, or "auto" to pick the highest cost whose hash
+# takes at most BCRYPT_TARGET_MS on this CPU (under gunicorn, once in the master). Logins
+# rehash passwords stored at a cost more than BCRYPT_ROUNDS_TOLERANCE away from it; the
+# default of 1 keeps hashes from flipping between pods that calibrate to neighbouring costs.
+BCRYPT_ROUNDS = os.getenv("BCRYPT_ROUNDS", "12").lower()
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "10"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+BCRYPT_ROUNDS_TOLERANCE = int(os.getenv("BCRYPT_ROUNDS_TOLERANCE", "1"))
+
+# passlib and jose are imported on first use so they stay off the start-up path.
+# Hashing runs in worker processes, so the cost is passed to them with each job and each
+# process keeps one context per cost.
+_pwd_contexts = {}
+_bcrypt_rounds = None
+_rounds_lock = threading.Lock()
+
+# Times one bcrypt hash at BCRYPT_MIN_ROUNDS and scales up: each extra round doubles the cost.
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    from passlib.hash import bcrypt
+    handler = bcrypt.using(rounds=BCRYPT_MIN_ROUNDS)
+    elapsed = min(_time_call(handler.hash, "calibration") for _ in range(3))
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and elapsed * 2 * 1000 <= target_ms:
+        rounds += 1
+        elapsed *= 2
+    return rounds
+
+def _time_call(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+# Returns the configured bcrypt cost, calibrating it on first use when BCRYPT_ROUNDS=auto.
+def get_bcrypt_rounds() -> int:
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        with _rounds_lock:
+            if _bcrypt_rounds is None:
+                if BCRYPT_ROUNDS == "auto":
+                    _bcrypt_rounds = calibrate_bcrypt_rounds()
+                    print(f"Calibrated bcrypt cost to {_bcrypt_rounds} rounds for a {BCRYPT_TARGET_MS:.0f} ms target.")
+                else:
+                    _bcrypt_rounds = int(BCRYPT_ROUNDS)
+    return _bcrypt_rounds
+
+def get_pwd_context(rounds: Optional[int] = None):
+    rounds = rounds or get_bcrypt_rounds()
+    context = _pwd_contexts.get(rounds)
+    if context is None:
+        from passlib.context import CryptContext
+        context = _pwd_contexts[rounds] = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=max(4, rounds - BCRYPT_ROUNDS_TOLERANCE),
+            bcrypt__max_rounds=min(31, rounds + BCRYPT_ROUNDS_TOLERANCE),
+        )
+    return context
 
 # Hashes a password.
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    return get_pwd_context(rounds).hash(password)
 
 # Verifies a password against a hashed password.
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_password(plain_password: str, hashed_password: str, rounds: Optional[int] = None) -> bool:
+    return get_pwd_context(rounds).verify(plain_password, hashed_password)
+
+# Verifies a password and, if the stored hash uses another cost, returns a rehash at `rounds`.
+# Returns (verified, new hash or None).
+def verify_and_update(plain_password: str, hashed_password: str, rounds: Optional[int] = None):
+    return get_pwd_context(rounds).verify_and_update(plain_password, hashed_password)
+
+# Hashing executor configuration.
+# bcrypt is CPU bound, so it runs in a process pool sized to the CPU quota instead of
+# on the request threadpool. HASH_WORKERS=0 falls back to the default threadpool.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(available_cpus())))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", str(max(HASH_WORKERS, 1) * 8)))
+
+_hash_executor = None
+_hash_pending = 0
+_hash_lock = threading.Lock()
+
+# Raised when more hashing jobs are pending than HASH_QUEUE_SIZE allows.
+class HashingQueueFull(Exception):
+    pass
+
+# Returns the shared hashing executor, creating it on first use.
+# It is created once threads are running (the event loop's, the replica prober's), so its
+# processes come from a forkserver instead of forking a copy of those threads' locks.
+def get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None and HASH_WORKERS > 0:
+        with _hash_lock:
+            if _hash_executor is None:
+                _hash_executor = ProcessPoolExecutor(
+                    max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+                )
+    return _hash_executor
+
+# Shuts down the hashing executor, waiting for in-flight jobs.
+def shutdown_hash_executor():
+    global _hash_executor
+    with _hash_lock:
+        executor, _hash_executor = _hash_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+# Runs a hashing function on the executor, rejecting work once the queue is full.
+async def _run_hashing(func, *args):
+    global _hash_pending
+    with _hash_lock:
+        if _hash_pending >= HASH_QUEUE_SIZE:
+            raise HashingQueueFull("Password hashing queue is full")
+        _hash_pending += 1
+    start = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_executor(), func, *args)
+    finally:
+        with _hash_lock:
+            _hash_pending -= 1
+        metrics.hashing_latency.observe(time.perf_counter() - start, func.__name__)
+
+# Hashes a password without blocking the event loop.
+async def hash_password_async(password: str) -> str:
+    return await _run_hashing(hash_password, password, get_bcrypt_rounds())
+
+# Verifies a password without blocking the event loop.
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(verify_password, plain_password, hashed_password, get_bcrypt_rounds())
+
+# verify_and_update without blocking the event loop.
+async def verify_and_update_async(plain_password: str, hashed_password: str):
+    return await _run_hashing(verify_and_update, plain_password, hashed_password, get_bcrypt_rounds())
 
 # Creates an access token.
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -32,5 +171,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+# Decodes and verifies an access token. Returns None if it is invalid or expired.
+def decode_access_token(token: str) -> Optional[dict]:
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+# Loads the deferred auth libraries and the bcrypt backend, and settles the bcrypt cost,
+# ahead of the first login.
+def warm_up():
+    import jose.jwt
+    get_pwd_context().handler().get_backend()
+
+# Runs warm_up on a daemon thread so start-up does not wait for it.
+def warm_up_in_background():
+    threading.Thread(target=warm_up, name="auth-warm-up", daemon=True).start()
+
+# --- Verified token cache ---
+# Maps a token digest to its decoded claims and a slim user record until the token
+# expires, capped at TOKEN_CACHE_TTL. A cached token skips the user lookup, so after a user
+# is deleted or their password changed in the database, tokens already issued keep
+# authenticating for up to TOKEN_CACHE_TTL seconds on each process that cached them.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+token_cache = MemoryCache(max_entries=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+# Returns the cached (claims, user) pair for a token, or None.
+def get_cached_token(token: str):
+    return token_cache.get(token_digest(token))
+
+# Caches a verified token's claims with a slim user record and returns that record.
+def cache_token(token: str, claims: dict, user) -> schemas.UserResponse:
+    record = schemas.UserResponse.model_construct(id=user.id, email=user.email)
+    exp = claims.get("exp")
+    if exp is not None:
+        token_cache.set(token_digest(token), (claims, record), ttl=exp - time.time())
+    return record
+
@@ -0,0 +1,403 @@
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from decimal import Decimal
+import orjson
+from sqlalchemy import Column, DateTime, Integer, MetaData, Numeric, String, Table, func, select, text
+from app.cpu import available_cpus
+
+# --- Logical backup and restore (DR) ---
+# A backup is a directory of gzipped NDJSON chunks plus manifest.json. Each chunk holds one id
+# range of one table, one JSON array per row in the manifest's column order, and the manifest
+# records per chunk the row count, the sha256 of the file and the sha256 of the uncompressed
+# rows. The manifest is written last, so a directory without one is an unfinished dump.
+#   dump    - chunks are read and written in parallel worker processes. On Postgres every
+#             worker reads from the same exported snapshot (as pg_dump -j does), so the backup
+#             is consistent; on SQLite (local stand-in) each chunk is read on its own.
+#   restore - loads chunks in parallel into the database at DATABASE_URL, COPY on Postgres and
+#             executemany elsewhere. Each chunk commits together with its row in
+#             backup_restore_progress, so a re-run with --resume loads only the missing chunks.
+#   verify  - recomputes row counts and row checksums from the database for every chunk.
+# Users are backed up with their password hashes, so the files are created owner-only.
+
+# Rows aimed for per chunk; chunks are id ranges, so sparse ids give smaller chunks.
+BACKUP_CHUNK_ROWS = int(os.getenv("BACKUP_CHUNK_ROWS", "50000"))
+BACKUP_JOBS = int(os.getenv("BACKUP_JOBS", str(available_cpus())))
+BACKUP_COMPRESS_LEVEL = int(os.getenv("BACKUP_COMPRESS_LEVEL", "6"))
+# Rows fetched per round trip from the server-side cursor.
+BACKUP_BATCH_SIZE = int(os.getenv("BACKUP_BATCH_SIZE", "5000"))
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+TABLES = ("users", "products")
+
+# Kept outside Base.metadata, like schema_version: it only exists on restored databases.
+progress_metadata = MetaData()
+restore_progress = Table(
+    "backup_restore_progress",
+    progress_metadata,
+    Column("backup_id", String, primary_key=True),
+    Column("chunk", String, primary_key=True),
+    Column("rows", Integer),
+    Column("restored_at", DateTime(timezone=True)),
+)
+
+class BackupError(Exception):
+    pass
+
+def _table(name: str):
+    from app import models
+    return {"products": models.Product.__table__, "users": models.User.__table__}[name]
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError
+
+# One row as written to a chunk. Decimals keep their exact digits as strings and JSON
+# values are written with sorted keys, so the same row always encodes to the same bytes.
+def _encode_row(row) -> bytes:
+    return orjson.dumps(list(row), default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+def _chunk_rows(conn, table, columns, low: int, high: int):
+    stmt = (
+        select(*[table.c[column] for column in columns])
+        .where(table.c.id >= low, table.c.id < high)
+        .order_by(table.c.id)
+    )
+    result = conn.execution_options(stream_results=True, yield_per=BACKUP_BATCH_SIZE).execute(stmt)
+    for partition in result.partitions():
+        yield from partition
+
+# Joins the parent's Postgres snapshot; must run before anything else in the transaction.
+def _use_snapshot(conn, snapshot):
+    if snapshot:
+        conn.execution_options(isolation_level="REPEATABLE READ")
+        conn.execute(text("SET TRANSACTION SNAPSHOT :snapshot"), {"snapshot": snapshot})
+
+# Splits a table into id ranges [low, high) of roughly chunk_rows rows each.
+def plan_chunks(conn, table, chunk_rows: int = BACKUP_CHUNK_ROWS):
+    low, high, count = conn.execute(select(func.min(table.c.id), func.max(table.c.id), func.count())).first()
+    if not count:
+        return []
+    step = max(1, math.ceil(chunk_rows * (high - low + 1) / count))
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+# Passes the sha256 of everything written through to the file underneath.
+class _HashingWriter(io.RawIOBase):
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.raw.write(data)
+
+def _init_worker():
+    from app.db import engine
+    # close=False leaves the parent's connections (and its snapshot) alone.
+    engine.dispose(close=False)
+
+# Runs fn over the tasks in jobs worker processes (inline when jobs <= 1), yielding results
+# as they finish.
+def _run_parallel(fn, tasks, jobs: int):
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield fn(*task)
+        return
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=_init_worker) as pool:
+        for future in as_completed([pool.submit(fn, *task) for task in tasks]):
+            yield future.result()
+
+# Worker: writes one id range of a table to a chunk file.
+def _dump_chunk(name, columns, low, high, path, snapshot):
+    from app.db import engine
+    content = hashlib.sha256()
+    rows = 0
+    with engine.connect() as conn, open(path + ".part", "wb") as raw:
+        _use_snapshot(conn, snapshot)
+        os.chmod(path + ".part", 0o600)
+        writer = _HashingWriter(raw)
+        # mtime=0 keeps the file bytes the same for the same rows.
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=BACKUP_COMPRESS_LEVEL, mtime=0) as out:
+            for row in _chunk_rows(conn, _table(name), columns, low, high):
+                line = _encode_row(row)
+                content.update(line)
+                out.write(line)
+                rows += 1
+    os.replace(path + ".part", path)
+    return name, {
+        "file": os.path.basename(path),
+        "id_from": low,
+        "id_to": high,
+        "rows": rows,
+        "bytes": os.path.getsize(path),
+        "sha256": writer.sha256.hexdigest(),
+        "content_sha256": content.hexdigest(),
+    }
+
+def load_manifest(backup_dir: str) -> dict:
+    try:
+        with open(os.path.join(backup_dir, MANIFEST), "rb") as f:
+            manifest = orjson.loads(f.read())
+    except FileNotFoundError:
+        raise BackupError(f"No {MANIFEST} in {backup_dir}; the dump did not finish")
+    if manifest.get("format") != FORMAT_VERSION:
+        raise BackupError(f"Unsupported backup format {manifest.get('format')}")
+    return manifest
+
+# Dumps the tables into backup_dir, which must not already hold a backup.
+# Returns the manifest.
+def dump(backup_dir: str, tables=TABLES, jobs: int = BACKUP_JOBS, chunk_rows: int = BACKUP_CHUNK_ROWS) -> dict:
+    from app.db import engine
+    from app.migrations import get_schema_version
+    if os.path.exists(os.path.join(backup_dir, MANIFEST)):
+        raise BackupError(f"{backup_dir} already holds a backup")
+    os.makedirs(backup_dir, mode=0o700, exist_ok=True)
+    started = datetime.now(timezone.utc)
+    manifest = {
+        "format": FORMAT_VERSION,
+        "backup_id": started.strftime("%Y%m%dT%H%M%S.%fZ"),
+        "created_at": started.isoformat(),
+        "dialect": engine.dialect.name,
+        "tables": {},
+    }
+    tasks = []
+    with engine.connect() as conn:
+        snapshot = None
+        if conn.dialect.name == "postgresql":
+            # Held open until every worker has read its chunks.
+            conn.execution_options(isolation_level="REPEATABLE READ")
+            snapshot = conn.execute(text("SELECT pg_export_snapshot()")).scalar()
+        manifest["snapshot"] = snapshot is not None
+        manifest["schema_version"] = get_schema_version(conn)
+        for name in tables:
+            table = _table(name)
+            columns = [column.name for column in table.columns]
+            manifest["tables"][name] = {"columns": columns, "rows": 0, "chunks": []}
+            for index, (low, high) in enumerate(plan_chunks(conn, table, chunk_rows)):
+                path = os.path.join(backup_dir, f"{name}-{index:05d}.ndjson.gz")
+                tasks.append((name, columns, low, high, path, snapshot))
+        for name, chunk in _run_parallel(_dump_chunk, tasks, jobs):
+            manifest["tables"][name]["chunks"].append(chunk)
+    for entry in manifest["tables"].values():
+        entry["chunks"].sort(key=lambda chunk: chunk["id_from"])
+        entry["rows"] = sum(chunk["rows"] for chunk in entry["chunks"])
+    path = os.path.join(backup_dir, MANIFEST)
+    with open(path + ".part", "wb") as f:
+        os.chmod(path + ".part", 0o600)
+        f.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
+    os.replace(path + ".part", path)
+    return manifest
+
+# Reads a chunk file, checking both checksums, and returns its rows.
+def read_chunk(backup_dir: str, chunk: dict):
+    with open(os.path.join(backup_dir, chunk["file"]), "rb") as f:
+        data = f.read()
+    if hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+        raise BackupError(f"{chunk['file']}: file checksum mismatch")
+    content = gzip.decompress(data)
+    if hashlib.sha256(content).hexdigest() != chunk["content_sha256"]:
+        raise BackupError(f"{chunk['file']}: content checksum mismatch")
+    return [orjson.loads(line) for line in content.splitlines()]
+
+# A value in COPY's text format.
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = orjson.dumps(value).decode()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def _copy_rows(conn, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+def _insert_rows(conn, table, columns, rows):
+    numeric = [i for i, column in enumerate(columns) if isinstance(table.c[column].type, Numeric)]
+    params = []
+    for row in rows:
+        for i in numeric:
+            if row[i] is not None:
+                row[i] = Decimal(row[i])
+        params.append(dict(zip(columns, row)))
+    conn.execute(table.insert(), params)
+
+# Worker: loads one chunk and records it as restored, in one transaction.
+def _restore_chunk(backup_dir, backup_id, name, columns, chunk):
+    from app.db import engine
+    rows = read_chunk(backup_dir, chunk)
+    table = _table(name)
+    with engine.begin() as conn:
+        done = select(restore_progress.c.rows).where(
+            restore_progress.c.backup_id == backup_id, restore_progress.c.chunk == chunk["file"]
+        )
+        if conn.execute(done).first() is not None:
+            return 0
+        if rows:
+            if conn.dialect.name == "postgresql":
+                _copy_rows(conn, table, columns, rows)
+            else:
+                _insert_rows(conn, table, columns, rows)
+        conn.execute(restore_progress.insert().values(
+            backup_id=backup_id, chunk=chunk["file"], rows=len(rows), restored_at=datetime.now(timezone.utc),
+        ))
+    return len(rows)
+
+# Restores a backup into the database at DATABASE_URL. Without resume the tables must be
+# empty; with it, chunks already recorded in backup_restore_progress are skipped.
+# Returns the number of rows loaded by this run.
+def restore(backup_dir: str, jobs: int = BACKUP_JOBS, resume: bool = False) -> int:
+    from app.db import engine
+    from app import feed, migrations, stats
+    manifest = load_manifest(backup_dir)
+    migrations.ensure_schema(engine, mode="auto")
+    progress_metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name, entry in manifest["tables"].items():
+            missing = set(entry["columns"]) - {column.name for column in _table(name).columns}
+            if missing:
+                raise BackupError(f"{name} has no column(s) {', '.join(sorted(missing))} in this schema")
+            if not resume and conn.execute(select(func.count()).select_from(_table(name))).scalar():
+                raise BackupError(f"{name} is not empty; restore into a fresh database or pass --resume")
+        done = set(conn.execute(
+            select(restore_progress.c.chunk).where(restore_progress.c.backup_id == manifest["backup_id"])
+        ).scalars())
+        # Without the summary and feed rows the stats and feed triggers do nothing (and take
+        # no lock), so product chunks load in parallel and restored rows are not broadcast as
+        # changes. The summary is rebuilt and the feed reset once at the end.
+        conn.execute(text("DELETE FROM product_stats"))
+        feed_version = feed.head_version(conn)
+        conn.execute(text("DELETE FROM product_feed"))
+    if engine.dialect.name == "sqlite" and jobs > 1:
+        print("SQLite takes one writer at a time; restoring with one job.", file=sys.stderr)
+        jobs = 1
+    tasks = [
+        (backup_dir, manifest["backup_id"], name, entry["columns"], chunk)
+        for name, entry in manifest["tables"].items()
+        for chunk in entry["chunks"]
+        if chunk["file"] not in done
+    ]
+    loaded = sum(_run_parallel(_restore_chunk, tasks, jobs))
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Rows came in with their ids, so move each id sequence past them.
+            for name in manifest["tables"]:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) FROM {name}"
+                ))
+        stats.rebuild(conn)
+        # Past the old head, so clients and caches holding that version start over.
+        feed.reset(conn, feed_version + 1)
+    return loaded
+
+# Worker: compares one chunk with the rows now in the database.
+def _verify_chunk(backup_dir, name, columns, chunk, snapshot):
+    from app.db import engine
+    problems = []
+    try:
+        read_chunk(backup_dir, chunk)
+    except (OSError, BackupError) as e:
+        problems.append(str(e))
+    content = hashlib.sha256()
+    rows = 0
+    with engine.connect() as conn:
+        _use_snapshot(conn, snapshot)
+        for row in _chunk_rows(conn, _table(name), columns, chunk["id_from"], chunk["id_to"]):
+            content.update(_encode_row(row))
+            rows += 1
+    if rows != chunk["rows"]:
+        problems.append(f"{chunk['file']}: {rows} rows in the database, {chunk['rows']} in the backup")
+    elif content.hexdigest() != chunk["content_sha256"]:
+        problems.append(f"{chunk['file']}: rows differ from the backup")
+    return problems
+
+# Checks the database at DATABASE_URL against a backup: every chunk file against its
+# checksums, every id range against its row count and row checksum, and each table's total.
+# Returns the list of problems, empty if everything matches.
+def verify(backup_dir: str, jobs: int = BACKUP_JOBS) -> list:
+    from app.db import engine
+    manifest = load_manifest(backup_dir)
+    problems = []
+    with engine.connect() as conn:
+        snapshot = None
+        if conn.dialect.name == "postgresql":
+            conn.execution_options(isolation_level="REPEATABLE READ")
+            snapshot = conn.execute(text("SELECT pg_export_snapshot()")).scalar()
+        for name, entry in manifest["tables"].items():
+            count = conn.execute(select(func.count()).select_from(_table(name))).scalar()
+            if count != entry["rows"]:
+                problems.append(f"{name}: {count} rows in the database, {entry['rows']} in the backup")
+        tasks = [
+            (backup_dir, name, entry["columns"], chunk, snapshot)
+            for name, entry in manifest["tables"].items()
+            for chunk in entry["chunks"]
+        ]
+        for chunk_problems in _run_parallel(_verify_chunk, tasks, jobs):
+            problems += chunk_problems
+    return problems
+
+# Command line, against the database at DATABASE_URL:
+#   python -m app.backup dump /backups/2024-05-01 --jobs 4
+#   python -m app.backup restore /backups/2024-05-01 [--resume]
+#   python -m app.backup verify /backups/2024-05-01
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel, chunked logical backup and restore of users and products.")
+    parser.add_argument("command", choices=("dump", "restore", "verify"))
+    parser.add_argument("directory")
+    parser.add_argument("--jobs", type=int, default=BACKUP_JOBS, help="worker processes")
+    parser.add_argument("--chunk-rows", type=int, default=BACKUP_CHUNK_ROWS, help="rows per chunk (dump)")
+    parser.add_argument("--tables", default=",".join(TABLES), help="comma separated tables (dump)")
+    parser.add_argument("--resume", action="store_true", help="skip chunks a previous restore loaded")
+    args = parser.parse_args(argv)
+
+    # app.db logs to stdout on import; keep that out of the JSON report.
+    with contextlib.redirect_stdout(sys.stderr):
+        import app.db  # noqa: F401
+    start = time.perf_counter()
+    try:
+        if args.command == "dump":
+            tables = [name.strip() for name in args.tables.split(",") if name.strip()]
+            unknown = set(tables) - set(TABLES)
+            if unknown:
+                parser.error(f"unknown table(s): {', '.join(sorted(unknown))}")
+            manifest = dump(args.directory, tables, args.jobs, args.chunk_rows)
+            rows = sum(entry["rows"] for entry in manifest["tables"].values())
+            report = {"backup_id": manifest["backup_id"], "rows": rows,
+                      "chunks": sum(len(entry["chunks"]) for entry in manifest["tables"].values())}
+        elif args.command == "restore":
+            rows = restore(args.directory, args.jobs, args.resume)
+            report = {"rows": rows}
+        else:
+            problems = verify(args.directory, args.jobs)
+            rows = sum(entry["rows"] for entry in load_manifest(args.directory)["tables"].values())
+            report = {"rows": rows, "ok": not problems, "problems": problems}
+    except BackupError as e:
+        sys.exit(f"{args.command} failed: {e}")
+    elapsed = time.perf_counter() - start
+    report.update(seconds=round(elapsed, 2), rows_per_sec=round(rows / elapsed) if elapsed else None)
+    sys.stdout.write(orjson.dumps(report, option=orjson.OPT_INDENT_2).decode() + "\n")
+    if report.get("ok") is False:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
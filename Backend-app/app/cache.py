@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from app.failover import retry_idempotent
+
+# Product read cache configuration.
+PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "1024"))
+PRODUCT_CACHE_TTL = float(os.getenv("PRODUCT_CACHE_TTL", "60"))  # Seconds, 0 disables the cache
+
+# Interface for cache backends. A shared store (e.g. Redis) can replace the
+# in-memory backend by implementing these methods and calling set_product_cache().
+class CacheBackend:
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value):
+        raise NotImplementedError
+
+    # Drops every entry. Entries are keyed by catalogue version, so this only frees memory early.
+    def invalidate(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+# In-process TTL + LRU cache.
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entries: int = PRODUCT_CACHE_SIZE, ttl: float = PRODUCT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # ttl overrides the cache-wide TTL for this entry.
+    def set(self, key: str, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+product_cache: CacheBackend = MemoryCache()
+
+# Replaces the product cache backend, e.g. with a shared store.
+def set_product_cache(backend: CacheBackend):
+    global product_cache
+    product_cache = backend
+
+# The catalogue version is product_feed.version, which the feed triggers advance in the same
+# transaction as every product write. Every worker and pod reads the same counter, so a write
+# anywhere changes the cache keys and the ETag everywhere.
+# Each process keeps the last version it read per backend for CATALOGUE_VERSION_TTL seconds,
+# so conditional GETs are answered without a query. Its own writes forget the version at
+# once, and the change feed hub pushes newer versions as it reads them (at once with
+# Postgres NOTIFY), so other processes' writes show within the TTL.
+CATALOGUE_VERSION_TTL = float(os.getenv("CATALOGUE_VERSION_TTL", "1"))  # Seconds, 0 reads it on every request
+
+_known_versions = {}  # backend -> (version, expires_at)
+_known_lock = threading.Lock()
+_generation = 0  # Bumped by every local write; versions read before it are not kept
+
+def _known_version(backend: str):
+    entry = _known_versions.get(backend)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def version_generation() -> int:
+    return _generation
+
+# Keeps a version read at `generation` unless this process has written since.
+# Only moves forward, so a slow reader cannot replace a newer version.
+def remember_version(backend: str, version, generation: int):
+    if version is None or CATALOGUE_VERSION_TTL <= 0:
+        return
+    with _known_lock:
+        current = _known_versions.get(backend)
+        if generation != _generation or (current is not None and current[0] > version):
+            return
+        _known_versions[backend] = (version, time.monotonic() + CATALOGUE_VERSION_TTL)
+
+# Call after committing a product write: drops cached entries and the known versions.
+def catalogue_changed():
+    global _generation
+    with _known_lock:
+        _generation += 1
+        _known_versions.clear()
+    product_cache.invalidate()
+
+@retry_idempotent
+def _read_version(db):
+    return db.execute(text("SELECT version FROM product_feed WHERE id = 1")).scalar()
+
+# The catalogue version for a session, read once per session.
+def catalogue_version(db):
+    if "catalogue_version" not in db.info:
+        backend = db.info.get("backend", "primary")
+        version = _known_version(backend)
+        if version is None:
+            generation = _generation
+            version = _read_version(db)
+            remember_version(backend, version, generation)
+        db.info["catalogue_version"] = version
+    return db.info["catalogue_version"]
+
+# Async variant of catalogue_version.
+async def catalogue_version_async(db):
+    if "catalogue_version" not in db.info:
+        backend = db.info.get("backend", "primary")
+        version = _known_version(backend)
+        if version is None:
+            generation = _generation
+            result = await db.execute(text("SELECT version FROM product_feed WHERE id = 1"))
+            version = result.scalar()
+            remember_version(backend, version, generation)
+        db.info["catalogue_version"] = version
+    return db.info["catalogue_version"]
+
+# Returns the cached value for a key, calling loader and caching its result on a miss.
+# Values are keyed by the session's backend and catalogue version, so a write makes every
+# older entry unreachable and replica results never answer primary reads. Without a feed
+# row, or on a session marked uncacheable (a lagging replica), the cache is bypassed.
+def get_or_load(db, key: str, loader):
+    version = catalogue_version(db)
+    if version is None or not db.info.get("cacheable", True):
+        return loader()
+    versioned_key = f"{db.info.get('backend', 'primary')}:{version}:{key}"
+    value = product_cache.get(versioned_key)
+    if value is None:
+        value = loader()
+        if value is not None:
+            product_cache.set(versioned_key, value)
+    return value
+
+# Async variant of get_or_load for loaders that await the database.
+async def get_or_load_async(db, key: str, loader):
+    version = await catalogue_version_async(db)
+    if version is None or not db.info.get("cacheable", True):
+        return await loader()
+    versioned_key = f"{db.info.get('backend', 'primary')}:{version}:{key}"
+    value = product_cache.get(versioned_key)
+    if value is None:
+        value = await loader()
+        if value is not None:
+            product_cache.set(versioned_key, value)
+    return value
+
+# Strong ETag for the catalogue version, or None without a feed row.
+def catalogue_etag(db):
+    version = catalogue_version(db)
+    return None if version is None else f'"{version}"'
+
+# Async variant of catalogue_etag.
+async def catalogue_etag_async(db):
+    version = await catalogue_version_async(db)
+    return None if version is None else f'"{version}"'
+
+# Whether an If-None-Match header matches the given ETag.
+def etag_matches(if_none_match: str, etag) -> bool:
+    if not if_none_match or etag is None:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
@@ -0,0 +1,35 @@
+import math
+import os
+
+# --- CPU budget ---
+# os.cpu_count() is the node's core count. In a container the CFS quota (the pod's CPU
+# limit) decides how much CPU the process really gets, so pools sized from the node
+# count oversubscribe it and bcrypt or resize jobs just queue in the kernel.
+
+# Returns the cgroup CPU quota in cores (cgroup v2, then v1), or None if there is no limit.
+def cgroup_cpu_quota():
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+# Cores this process can use: the CPU affinity mask, capped by the quota rounded up.
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(cpus, 1)
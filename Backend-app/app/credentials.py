@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+import time
+
+# Credential cache configuration.
+DB_CREDENTIALS_TTL = float(os.getenv("DB_CREDENTIALS_TTL", "3600"))  # Seconds between Secrets Manager fetches
+# Optional encrypted on-disk cache so pod restarts can skip Secrets Manager.
+# The key is a Fernet key (cryptography.fernet.Fernet.generate_key()); without it nothing is written.
+DB_CREDENTIALS_CACHE_PATH = os.getenv("DB_CREDENTIALS_CACHE_PATH")
+DB_CREDENTIALS_CACHE_KEY = os.getenv("DB_CREDENTIALS_CACHE_KEY")
+
+REQUIRED_KEYS = ("username", "password", "host", "port", "db_name")
+
+# Lazily loads database credentials from AWS Secrets Manager.
+# Nothing is fetched until the first connection needs credentials; the result is cached
+# in memory for DB_CREDENTIALS_TTL and refreshed on demand after a rotation.
+class SecretsManagerCredentials:
+    def __init__(self, secret_arn: str, region: str, ttl: float = DB_CREDENTIALS_TTL,
+                 cache_path: str = DB_CREDENTIALS_CACHE_PATH, cache_key: str = DB_CREDENTIALS_CACHE_KEY,
+                 client=None):
+        self.secret_arn = secret_arn
+        self.region = region
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.cache_key = cache_key
+        self._client = client
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._fetched_at = 0.0
+        self.fetches = 0
+
+    # One Secrets Manager client is created on first use and reused for every refresh.
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.session.Session().client(service_name="secretsmanager", region_name=self.region)
+        return self._client
+
+    # Returns the current credentials, fetching them if missing or expired.
+    def get(self) -> dict:
+        with self._lock:
+            if self._credentials is None:
+                self._load_disk_cache()
+            if self._credentials is None or time.time() - self._fetched_at > self.ttl:
+                self._fetch()
+            return self._credentials
+
+    # Forces a fetch, e.g. after Postgres rejected the cached password.
+    def refresh(self) -> dict:
+        with self._lock:
+            self._fetch()
+            return self._credentials
+
+    # Whether credentials are loaded, without triggering a fetch.
+    def is_loaded(self) -> bool:
+        return self._credentials is not None
+
+    def _fetch(self):
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client().get_secret_value(SecretId=self.secret_arn)
+        except ClientError as e:
+            print(f"Error retrieving secret '{self.secret_arn}': {e}")
+            raise
+        if "SecretString" not in response:
+            print("Binary secret detected, not supported for this database connection.")
+            raise ValueError("Binary secrets are not supported for database credentials.")
+        credentials = json.loads(response["SecretString"])
+        missing = [key for key in REQUIRED_KEYS if key not in credentials]
+        if missing:
+            raise RuntimeError(f"Invalid database secret structure, missing keys: {missing}")
+        self._credentials = credentials
+        self._fetched_at = time.time()
+        self.fetches += 1
+        print(f"Successfully retrieved database credentials from secret: {self.secret_arn}")
+        self._save_disk_cache()
+
+    def _fernet(self):
+        if not (self.cache_path and self.cache_key):
+            return None
+        from cryptography.fernet import Fernet
+        return Fernet(self.cache_key.encode())
+
+    def _load_disk_cache(self):
+        fernet = self._fernet()
+        if fernet is None or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "rb") as f:
+                payload = json.loads(fernet.decrypt(f.read(), ttl=int(self.ttl)))
+        except Exception as e:
+            print(f"Ignoring unreadable credential cache {self.cache_path}: {e}")
+            return
+        self._credentials = payload["credentials"]
+        self._fetched_at = payload["fetched_at"]
+
+    def _save_disk_cache(self):
+        fernet = self._fernet()
+        if fernet is None:
+            return
+        payload = json.dumps({"credentials": self._credentials, "fetched_at": self._fetched_at})
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(fernet.encrypt(payload.encode()))
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.cache_path)
+
+# Whether a connection error means the server rejected the credentials.
+def is_auth_failure(exc: Exception) -> bool:
+    message = str(exc).lower()
+    return (
+        "password authentication failed" in message
+        or type(exc).__name__ == "InvalidPasswordError"
+        or type(getattr(exc, "orig", None)).__name__ == "InvalidPasswordError"
+    )
+
+# Fills in connection parameters from the provider when the pool opens a new connection.
+# If the server rejects them, the credentials are refetched once, so a rotated secret is
+# picked up without a restart; pooled connections move over as pool_recycle replaces them.
+# host/port override the secret's, e.g. for a read replica that shares the primary's login.
+def attach_credentials(db_engine, provider: SecretsManagerCredentials, host: str = None, port: int = None):
+    from sqlalchemy import event
+
+    @event.listens_for(db_engine, "do_connect")
+    def connect_with_credentials(dialect, conn_rec, cargs, cparams):
+        database_key = "dbname" if dialect.driver == "psycopg2" else "database"
+
+        def apply(credentials):
+            cparams.update(
+                user=credentials["username"],
+                password=credentials["password"],
+                host=host or credentials["host"],
+                port=int(port or credentials["port"]),
+            )
+            cparams[database_key] = credentials["db_name"]
+
+        apply(provider.get())
+        try:
+            return dialect.connect(*cargs, **cparams)
+        except Exception as e:
+            if not is_auth_failure(e):
+                raise
+            print("Database rejected cached credentials, refreshing from Secrets Manager")
+            apply(provider.refresh())
+            return dialect.connect(*cargs, **cparams)
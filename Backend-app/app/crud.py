@@ -1,50 +1,387 @@
+import base64
+import json
+import os
+from typing import Optional
+from sqlalchemy import select, insert, update, delete, values, column, Integer, String, DECIMAL
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
-from app import models, schemas
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, cache, feed
 from app.auth.auth import hash_password
+from app.failover import retry_idempotent
 
 # Gets a user by their email.
+@retry_idempotent
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
-# Creates a new user in the database.
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = hash_password(user.password)
-    db_user = models.User(email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
+# INSERT that skips rows conflicting on a unique column, where the dialect supports it.
+def _insert_ignoring_conflicts(db: Session, table, column: str):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=[column])
+
+# Creates a new user in one statement: INSERT ... ON CONFLICT DO NOTHING RETURNING.
+# Returns {"id", "email"}, or None if the email is already registered (race-free, no pre-check).
+# Callers that already hashed the password off the request thread pass it in.
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = hash_password(user.password)
+    users = models.User.__table__
+    values = {"email": user.email, "hashed_password": hashed_password}
+    stmt = _insert_ignoring_conflicts(db, users, "email")
+    try:
+        row = db.execute((stmt if stmt is not None else insert(users)).values(**values).returning(users.c.id, users.c.email)).first()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.commit()
+    return dict(row._mapping) if row else None
+
+# Upper bound on the page size of any product listing.
+MAX_PAGE_SIZE = 100
+
+# Stores a new password hash for a user, e.g. after a rehash at a different cost.
+def update_password_hash(db: Session, db_user: models.User, hashed_password: str):
+    db_user.hashed_password = hashed_password
     db.commit()
-    db.refresh(db_user)
-    return db_user
 
 # Gets all products from the database.
+@retry_idempotent
 def get_products(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Product).offset(skip).limit(limit).all()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return db.query(models.Product).offset(max(0, skip)).limit(limit).all()
+
+# Encodes a JSON-serialisable position as an opaque cursor token.
+def encode_cursor_value(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+# Decodes a cursor token back into its position.
+def decode_cursor_value(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+# Encodes the last seen product id as an opaque cursor token.
+def encode_cursor(last_id: int) -> str:
+    return encode_cursor_value({"id": last_id})
+
+# Decodes a cursor token back into a product id. An empty token starts from the beginning.
+def decode_cursor(token: str) -> int:
+    if not token:
+        return 0
+    try:
+        return int(decode_cursor_value(token)["id"])
+    except (KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+# Gets the page of products after a cursor, ordered by id.
+# Seeks on the primary key, so deep pages cost the same as the first one.
+# Returns the products and the cursor for the next page (None on the last page).
+@retry_idempotent
+def get_products_after(db: Session, after: str = "", limit: int = 100):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    products = (
+        db.query(models.Product)
+        .filter(models.Product.id > decode_cursor(after))
+        .order_by(models.Product.id)
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = encode_cursor(products[limit - 1].id) if len(products) > limit else None
+    return products[:limit], next_cursor
 
 # Gets a single product by its ID.
+@retry_idempotent
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
-# Creates a new product in the database.
+# --- Read-only rows ---
+# List reads select plain column tuples: no ORM instances, identity map or schema validation.
+# Rows come out in the same shape as ProductResponse dumped to JSON (price as an exact string).
+
+PRODUCT_COLUMNS = tuple(models.Product.__table__.c[name] for name in ("id", "name", "description", "price", "image_url", "image_variants"))
+
+def row_to_dict(row) -> dict:
+    product_id, name, description, price, image_url, image_variants = row
+    return {
+        "id": product_id,
+        "name": name,
+        "description": description,
+        "price": None if price is None else str(price),
+        "image_url": image_url,
+        "image_variants": image_variants,
+    }
+
+def _product_rows_stmt(skip: int, limit: int):
+    return select(*PRODUCT_COLUMNS).offset(max(0, skip)).limit(max(1, min(limit, MAX_PAGE_SIZE)))
+
+def _product_rows_after_stmt(after: str, limit: int):
+    return (
+        select(*PRODUCT_COLUMNS)
+        .where(models.Product.id > decode_cursor(after))
+        .order_by(models.Product.id)
+        .limit(limit + 1)
+    )
+
+def _rows_page(rows, limit: int):
+    items = [row_to_dict(row) for row in rows]
+    next_cursor = encode_cursor(items[limit - 1]["id"]) if len(items) > limit else None
+    return {"items": items[:limit], "next_cursor": next_cursor}
+
+# Gets a page of products as response dicts.
+@retry_idempotent
+def get_product_rows(db: Session, skip: int = 0, limit: int = 100):
+    return [row_to_dict(row) for row in db.execute(_product_rows_stmt(skip, limit))]
+
+# Gets the keyset page of products after a cursor as {"items", "next_cursor"}.
+@retry_idempotent
+def get_product_rows_after(db: Session, after: str = "", limit: int = 100):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return _rows_page(db.execute(_product_rows_after_stmt(after, limit)).all(), limit)
+
+# --- Cached reads ---
+# Products are cached as response dicts, never as ORM instances tied to a session.
+
+def product_to_dict(db_product: models.Product) -> dict:
+    return schemas.ProductResponse.model_validate(db_product).model_dump(mode="json")
+
+# Gets a page of products through the product cache.
+def get_products_cached(db: Session, skip: int = 0, limit: int = 100):
+    return cache.get_or_load(db, f"products:{skip}:{limit}", lambda: get_product_rows(db, skip=skip, limit=limit))
+
+# Gets a keyset page of products through the product cache.
+def get_products_after_cached(db: Session, after: str = "", limit: int = 100):
+    return cache.get_or_load(db, f"products_after:{after}:{limit}", lambda: get_product_rows_after(db, after=after, limit=limit))
+
+# Gets a single product through the product cache. Misses for unknown ids are not cached.
+def get_product_cached(db: Session, product_id: int):
+    def load():
+        db_product = get_product(db, product_id)
+        return product_to_dict(db_product) if db_product else None
+    return cache.get_or_load(db, f"product:{product_id}", load)
+
+# Creates a new product with INSERT ... RETURNING, so no refresh query is needed.
 def create_product(db: Session, product: schemas.ProductCreate):
-    db_product = models.Product(**product.dict())
-    db.add(db_product)
+    row = db.execute(insert(products_table).values(**product.model_dump()).returning(*PRODUCT_COLUMNS)).first()
     db.commit()
-    db.refresh(db_product)
-    return db_product
+    cache.catalogue_changed()
+    feed.notify()
+    return row_to_dict(row)
 
-# Updates an existing product.
+# Updates an existing product with UPDATE ... RETURNING. Returns None if it does not exist.
 def update_product(db: Session, product_id: int, product: schemas.ProductCreate):
-    db_product = get_product(db, product_id)
-    if db_product:
-        for key, value in product.dict().items():
-            setattr(db_product, key, value)
-        db.commit()
-        db.refresh(db_product)
-    return db_product
-
-# Deletes a product.
+    row = db.execute(
+        update(products_table).where(products_table.c.id == product_id).values(**product.model_dump()).returning(*PRODUCT_COLUMNS)
+    ).first()
+    if row is None:
+        db.rollback()
+        return None
+    db.commit()
+    cache.catalogue_changed()
+    feed.notify()
+    return row_to_dict(row)
+
+# Deletes a product with DELETE ... RETURNING. Returns the deleted id, or None if it did not exist.
 def delete_product(db: Session, product_id: int):
-    db_product = get_product(db, product_id)
-    if db_product:
-        db.delete(db_product)
-        db.commit()
-    return db_product
+    product_id = db.execute(delete(products_table).where(products_table.c.id == product_id).returning(products_table.c.id)).scalar()
+    if product_id is None:
+        db.rollback()
+        return None
+    db.commit()
+    cache.catalogue_changed()
+    feed.notify()
+    return product_id
+
+# Points a product at its processed images. Returns False if the product no longer exists.
+def set_product_images(db: Session, product_id: int, image_url: str, image_variants: dict) -> bool:
+    updated = db.execute(
+        update(products_table).where(products_table.c.id == product_id)
+        .values(image_url=image_url, image_variants=image_variants).returning(products_table.c.id)
+    ).scalar()
+    db.commit()
+    if updated is not None:
+        cache.catalogue_changed()
+        feed.notify()
+    return updated is not None
+
+# --- Bulk writes ---
+# Each chunk is one multi-row statement inside a SAVEPOINT of the caller's transaction.
+# If a chunk fails, its rows are retried one by one so the bad items can be reported.
+# Chunks are lists of (index, payload); callers commit after each chunk.
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+products_table = models.Product.__table__
+
+def _error_detail(e: SQLAlchemyError) -> str:
+    return str(getattr(e, "orig", None) or e).strip()
+
+# Runs write(pairs) -> [(index, id)] for a chunk. Returns (written, errors).
+def _write_chunk(db: Session, chunk, write):
+    try:
+        with db.begin_nested():
+            return write(chunk), []
+    except SQLAlchemyError as e:
+        if len(chunk) == 1:
+            return [], [(chunk[0][0], _error_detail(e))]
+    written, errors = [], []
+    for pair in chunk:
+        try:
+            with db.begin_nested():
+                written += write([pair])
+        except SQLAlchemyError as e:
+            errors.append((pair[0], _error_detail(e)))
+    return written, errors
+
+# Reports every item of a chunk that was neither written nor failed as not found.
+def _not_found(chunk, written, errors):
+    done = {index for index, _ in written} | {index for index, _ in errors}
+    return [(index, "Product not found") for index, _ in chunk if index not in done]
+
+# Inserts a chunk of (index, ProductCreate) with one INSERT ... RETURNING.
+def create_products_chunk(db: Session, chunk):
+    def write(pairs):
+        stmt = insert(products_table).returning(products_table.c.id, sort_by_parameter_order=True)
+        ids = db.execute(stmt, [product.model_dump() for _, product in pairs]).scalars().all()
+        return list(zip([index for index, _ in pairs], ids))
+    return _write_chunk(db, chunk, write)
+
+# Updates a chunk of (index, ProductBulkUpdate).
+# Postgres gets one UPDATE ... FROM (VALUES ...) RETURNING; other databases an executemany.
+def update_products_chunk(db: Session, chunk):
+    # The last occurrence of an id wins; earlier ones are reported.
+    latest = {item.id: index for index, item in chunk}
+    duplicates = [(index, "Duplicate id in batch") for index, item in chunk if latest[item.id] != index]
+    chunk = [(index, item) for index, item in chunk if latest[item.id] == index]
+    fields = ("name", "description", "price", "image_url")
+
+    def write_values(pairs):
+        rows = values(
+            column("id", Integer), column("name", String), column("description", String),
+            column("price", DECIMAL(10, 2)), column("image_url", String), name="v",
+        ).data([(item.id, item.name, item.description, item.price, item.image_url) for _, item in pairs])
+        stmt = (
+            update(products_table)
+            .where(products_table.c.id == rows.c.id)
+            .values({field: rows.c[field] for field in fields})
+            .returning(products_table.c.id)
+        )
+        found = set(db.execute(stmt).scalars().all())
+        return [(index, item.id) for index, item in pairs if item.id in found]
+
+    def write_executemany(pairs):
+        ids = [item.id for _, item in pairs]
+        found = set(db.execute(select(products_table.c.id).where(products_table.c.id.in_(ids))).scalars().all())
+        rows = [item.model_dump() for _, item in pairs if item.id in found]
+        if rows:
+            db.execute(update(models.Product), rows)
+        return [(index, item.id) for index, item in pairs if item.id in found]
+
+    write = write_values if db.get_bind().dialect.name == "postgresql" else write_executemany
+    written, errors = _write_chunk(db, chunk, write)
+    return written, duplicates + errors + _not_found(chunk, written, errors)
+
+# Deletes a chunk of (index, product id) with one DELETE ... RETURNING.
+def delete_products_chunk(db: Session, chunk):
+    def write(pairs):
+        stmt = delete(products_table).where(products_table.c.id.in_([product_id for _, product_id in pairs]))
+        found = set(db.execute(stmt.returning(products_table.c.id)).scalars().all())
+        return [(index, product_id) for index, product_id in pairs if product_id in found]
+    written, errors = _write_chunk(db, chunk, write)
+    return written, errors + _not_found(chunk, written, errors)
+
+
+# --- Async variants used when ASYNC_DB is enabled ---
+
+# Gets a user by their email.
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+# Gets all products from the database.
+async def get_products_async(db: AsyncSession, skip: int = 0, limit: int = 100):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    result = await db.execute(select(models.Product).offset(max(0, skip)).limit(limit))
+    return result.scalars().all()
+
+# Gets the page of products after a cursor, ordered by id.
+async def get_products_after_async(db: AsyncSession, after: str = "", limit: int = 100):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    result = await db.execute(
+        select(models.Product)
+        .where(models.Product.id > decode_cursor(after))
+        .order_by(models.Product.id)
+        .limit(limit + 1)
+    )
+    products = result.scalars().all()
+    next_cursor = encode_cursor(products[limit - 1].id) if len(products) > limit else None
+    return products[:limit], next_cursor
+
+# Gets a single product by its ID.
+async def get_product_async(db: AsyncSession, product_id: int):
+    return await db.get(models.Product, product_id)
+
+# Gets a page of products through the product cache.
+async def get_products_cached_async(db: AsyncSession, skip: int = 0, limit: int = 100):
+    async def load():
+        result = await db.execute(_product_rows_stmt(skip, limit))
+        return [row_to_dict(row) for row in result]
+    return await cache.get_or_load_async(db, f"products:{skip}:{limit}", load)
+
+# Gets a keyset page of products through the product cache.
+async def get_products_after_cached_async(db: AsyncSession, after: str = "", limit: int = 100):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    async def load():
+        result = await db.execute(_product_rows_after_stmt(after, limit))
+        return _rows_page(result.all(), limit)
+    return await cache.get_or_load_async(db, f"products_after:{after}:{limit}", load)
+
+# Gets a single product through the product cache.
+async def get_product_cached_async(db: AsyncSession, product_id: int):
+    async def load():
+        db_product = await get_product_async(db, product_id)
+        return product_to_dict(db_product) if db_product else None
+    return await cache.get_or_load_async(db, f"product:{product_id}", load)
+
+# Creates a new product with INSERT ... RETURNING.
+async def create_product_async(db: AsyncSession, product: schemas.ProductCreate):
+    result = await db.execute(insert(products_table).values(**product.model_dump()).returning(*PRODUCT_COLUMNS))
+    row = result.first()
+    await db.commit()
+    cache.catalogue_changed()
+    feed.notify()
+    return row_to_dict(row)
+
+# Updates an existing product with UPDATE ... RETURNING.
+async def update_product_async(db: AsyncSession, product_id: int, product: schemas.ProductCreate):
+    result = await db.execute(
+        update(products_table).where(products_table.c.id == product_id).values(**product.model_dump()).returning(*PRODUCT_COLUMNS)
+    )
+    row = result.first()
+    if row is None:
+        await db.rollback()
+        return None
+    await db.commit()
+    cache.catalogue_changed()
+    feed.notify()
+    return row_to_dict(row)
+
+# Deletes a product with DELETE ... RETURNING.
+async def delete_product_async(db: AsyncSession, product_id: int):
+    result = await db.execute(delete(products_table).where(products_table.c.id == product_id).returning(products_table.c.id))
+    product_id = result.scalar()
+    if product_id is None:
+        await db.rollback()
+        return None
+    await db.commit()
+    cache.catalogue_changed()
+    feed.notify()
+    return product_id
@@ -1,78 +1,152 @@
 import os
-import boto3
-import json
-from botocore.exceptions import ClientError
+import threading
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from dotenv import load_dotenv 
+from app.credentials import SecretsManagerCredentials, attach_credentials
+from app.failover import primary_breaker, attach_breaker
 
 load_dotenv()
 
 DB_SECRET_ARN = os.getenv("DB_SECRET_ARN")
 AWS_REGION = os.getenv("AWS_REGION", "eu-west-2")  # Default region if not specified
+# Optional explicit URL, e.g. sqlite:///./local.db for local runs and benchmarks.
+DATABASE_URL = os.getenv("DATABASE_URL")
 
 # Validate that required environment variable is set
-if not DB_SECRET_ARN:
+if not DB_SECRET_ARN and not DATABASE_URL:
     raise RuntimeError("DB_SECRET_ARN environment variable must be set in Kubernetes deployment")
 
+# Credentials are fetched lazily by the provider on the first connection,
+# so importing this module never waits on Secrets Manager.
+credentials_provider = None
+
+if DATABASE_URL:
+    SQLALCHEMY_DATABASE_URL = DATABASE_URL
+    print("Using DATABASE_URL from the environment")
+else:
+    credentials_provider = SecretsManagerCredentials(DB_SECRET_ARN, AWS_REGION)
+    # Host, port, user and password are filled in per connection by attach_credentials.
+    SQLALCHEMY_DATABASE_URL = "postgresql+psycopg2://"
+
 # Function to retrieve secret from AWS Secrets Manager
 def get_secret():
-    secret_name = DB_SECRET_ARN
-    region_name = AWS_REGION
-
-    # Create a Secrets Manager client.
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+    return credentials_provider.get()
 
-    try:
-        get_secret_value_response = client.get_secret_value(
-            SecretId=secret_name
-        )
-    except ClientError as e:
-        # Handle exceptions based on error code.
-        print(f"Error retrieving secret '{secret_name}': {e}")
-        raise e
-    else:
-        if 'SecretString' in get_secret_value_response:
-            secret = get_secret_value_response['SecretString']
-            return json.loads(secret) 
-        else:
-            print("Binary secret detected, not supported for this database connection.")
-            raise ValueError("Binary secrets are not supported for database credentials.")
-
-# Retrieve the database credentials
-try:
-    db_credentials = get_secret()
-    print(f"Successfully retrieved database credentials from secret: {DB_SECRET_ARN}")
-except Exception as e:
-    print(f"Failed to load database credentials from Secrets Manager: {e}")
-    raise RuntimeError("Application cannot start without database credentials.")
-
-# Construct the DATABASE_URL dynamically
-try:
-    SQLALCHEMY_DATABASE_URL = (
-        f"postgresql+psycopg2://" 
-        f"{db_credentials['username']}:"
-        f"{db_credentials['password']}@"
-        f"{db_credentials['host']}:"
-        f"{db_credentials['port']}/"
-        f"{db_credentials['db_name']}"
-    )
-    print(f"Successfully constructed DATABASE_URL using secret from {DB_SECRET_ARN}")
-except KeyError as e:
-    print(f"Missing expected key in database secret: {e}. Ensure secret structure is correct (username, password, host, port, db_name).")
-    raise RuntimeError("Invalid database secret structure.")
+# Seconds to wait for a new connection. Only the requests that trip the circuit breaker
+# (app/failover.py) wait this long when the database is down.
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+
+# Driver specific connection arguments.
+# SQLite is only used as a local stand-in, and its connections are shared across threadpool threads.
+def get_connect_args(url: str, async_driver: bool = False):
+    if url.startswith("sqlite"):
+        return {} if async_driver else {"check_same_thread": False}
+    if async_driver:
+        return {"timeout": DB_CONNECT_TIMEOUT}
+    return {"connect_timeout": DB_CONNECT_TIMEOUT}
+
+# --- Connection pool configuration ---
+# Sized per pod through the environment; use /health/pool under load to tune these.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds, -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"  # Drops dead connections after a failover
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"  # Logs every SQL statement, debugging only
+
+# Live checkout statistics for one pool.
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+
+    def record(self, elapsed: float, waited: bool, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.total_checkout_time += elapsed
+                self.max_checkout_time = max(self.max_checkout_time, elapsed)
+            if waited:
+                self.waits += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            avg = self.total_checkout_time / self.checkouts if self.checkouts else 0.0
+            return {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "avg_checkout_ms": round(avg * 1000, 3),
+                "max_checkout_ms": round(self.max_checkout_time * 1000, 3),
+            }
+
+# Times every checkout and counts the ones that had to wait for a free connection.
+class InstrumentedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        waited = self.checkedin() == 0 and self.overflow() >= self._max_overflow
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.stats.record(time.perf_counter() - start, waited, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start, waited)
+        return conn
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+# Pool arguments for an engine. In-memory SQLite cannot use a queue pool.
+def get_pool_args(url: str, async_driver: bool = False) -> dict:
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if async_driver else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Returns live statistics for an engine's pool, or None if it is not instrumented.
+def get_pool_stats(db_engine) -> dict:
+    stats = getattr(db_engine.pool, "stats", None)
+    if stats is None:
+        return None
+    return stats.snapshot(db_engine.pool)
 
 # Create a database engine.
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"connect_timeout": 10},
-    echo=True 
+    connect_args=get_connect_args(SQLALCHEMY_DATABASE_URL),
+    echo=DB_ECHO,
+    **get_pool_args(SQLALCHEMY_DATABASE_URL),
 )
+if credentials_provider is not None:
+    attach_credentials(engine, credentials_provider)
+attach_breaker(engine, primary_breaker, credentials_provider)
 
 # Create a session local class for each request.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -80,12 +154,56 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 # Dependency to get a database session for each request.
+# Fails fast with DatabaseUnavailable while the primary's circuit breaker is open.
 def get_db():
+    primary_breaker.check()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# --- Optional async mode ---
+# With ASYNC_DB=true the product endpoints use an AsyncEngine, so a request waiting on
+# the database holds no threadpool thread.
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB", "false").lower() == "true"
+
+# Maps a sync driver URL onto its async driver (asyncpg for Postgres, aiosqlite for SQLite).
+def to_async_url(url: str) -> str:
+    if url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url[len("postgresql+psycopg2://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+async_engine = None
+AsyncSessionLocal = None
+
+if ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args=get_connect_args(ASYNC_DATABASE_URL, async_driver=True),
+        echo=DB_ECHO,
+        **get_pool_args(ASYNC_DATABASE_URL, async_driver=True),
+    )
+    if credentials_provider is not None:
+        attach_credentials(async_engine.sync_engine, credentials_provider)
+    attach_breaker(async_engine.sync_engine, primary_breaker)
+    # expire_on_commit=False keeps returned objects readable after commit without lazy IO.
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Async dependency to get a database session for each request.
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database mode is disabled. Set ASYNC_DB=true to enable it.")
+    primary_breaker.check()
+    async with AsyncSessionLocal() as db:
+        yield db
         
         
         
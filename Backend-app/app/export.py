@@ -0,0 +1,95 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+from sqlalchemy import select
+
+# Rows fetched per round trip from the server-side cursor.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+# Bytes buffered before a chunk is handed to the response.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# Exportable tables and their columns. Password hashes are never exported.
+EXPORT_COLUMNS = {
+    "products": ("id", "name", "description", "price", "image_url"),
+    "users": ("id", "email"),
+}
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _table(name: str):
+    from app import models
+    return {"products": models.Product.__table__, "users": models.User.__table__}[name]
+
+# Yields rows of a table in id order through a server-side cursor.
+# Only EXPORT_BATCH_SIZE rows are held in memory at a time, whatever the table size.
+def iter_rows(db_engine, name: str, batch_size: int = EXPORT_BATCH_SIZE):
+    table = _table(name)
+    stmt = select(*[table.c[column] for column in EXPORT_COLUMNS[name]]).order_by(table.c.id)
+    with db_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for partition in result.partitions():
+            yield from partition
+
+def _value(value):
+    return value if value is None or isinstance(value, (int, str)) else str(value)
+
+# Encodes rows as NDJSON, yielding chunks of roughly EXPORT_CHUNK_BYTES.
+def iter_ndjson(rows, columns):
+    buffer = []
+    size = 0
+    for row in rows:
+        line = json.dumps({column: _value(value) for column, value in zip(columns, row)}) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+# Encodes rows as CSV with a header line, yielding chunks of roughly EXPORT_CHUNK_BYTES.
+def iter_csv(rows, columns):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if out.tell() >= EXPORT_CHUNK_BYTES:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+# Yields an encoded export of a table.
+def iter_export(db_engine, name: str, fmt: str = "ndjson"):
+    columns = EXPORT_COLUMNS[name]
+    encode = iter_csv if fmt == "csv" else iter_ndjson
+    return encode(iter_rows(db_engine, name), columns)
+
+# Command line export:
+#   python -m app.export products --format csv --output products.csv
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a table export as NDJSON or CSV.")
+    parser.add_argument("table", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("--format", choices=sorted(MEDIA_TYPES), default="ndjson")
+    parser.add_argument("--output", help="file to write (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    # app.db logs to stdout on import; keep that out of an export written to stdout.
+    with contextlib.redirect_stdout(sys.stderr):
+        from app.db import engine
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(engine, args.table, args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import functools
+import os
+import random
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+# --- Database circuit breaker ---
+# After DB_BREAKER_THRESHOLD consecutive connection failures the breaker opens: get_db
+# then fails at once with DatabaseUnavailable (a 503) instead of holding a threadpool
+# thread for the whole connect timeout. While open, a background thread probes every
+# DB_BREAKER_PROBE_INTERVAL seconds on a fresh pool, re-reading the endpoint from
+# Secrets Manager, and closes the breaker once the (possibly promoted) database answers.
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+DB_BREAKER_PROBE_INTERVAL = float(os.getenv("DB_BREAKER_PROBE_INTERVAL", "2"))
+DB_ENDPOINT_REFRESH_INTERVAL = float(os.getenv("DB_ENDPOINT_REFRESH_INTERVAL", "30"))  # Min seconds between secret re-reads
+
+# Idempotent reads are retried this many times on a dropped connection, with jittered backoff.
+DB_READ_RETRIES = int(os.getenv("DB_READ_RETRIES", "2"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.05"))  # Seconds
+
+# Raised instead of touching the database while the breaker is open.
+class DatabaseUnavailable(Exception):
+    pass
+
+# Whether an error means the connection to the database was lost or never made.
+def is_connection_error(exc: Exception) -> bool:
+    return isinstance(exc, DBAPIError) and (exc.connection_invalidated or isinstance(exc, OperationalError))
+
+class CircuitBreaker:
+    def __init__(self, name: str, threshold: int = DB_BREAKER_THRESHOLD, probe_interval: float = DB_BREAKER_PROBE_INTERVAL):
+        self.name = name
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.engine = None
+        self.credentials_provider = None
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._endpoint_refreshed_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    # Raises DatabaseUnavailable while the breaker is open.
+    def check(self):
+        if self.opened_at is not None:
+            raise DatabaseUnavailable(f"Database {self.name} is unavailable")
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None or self.failures < self.threshold:
+                return
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            self._probe_thread = threading.Thread(target=self._probe_until_recovered, name=f"db-probe-{self.name}", daemon=True)
+            self._probe_thread.start()
+        print(f"Database {self.name} unreachable after {self.failures} failures; failing fast until it recovers.")
+
+    def _probe_until_recovered(self):
+        while True:
+            time.sleep(self.probe_interval)
+            try:
+                self._refresh_endpoint()
+                # A fresh pool means new DNS lookups, so a promoted instance behind the same name is found.
+                self.engine.dispose()
+                with self.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+            except Exception as e:
+                print(f"Database {self.name} probe failed: {str(e).splitlines()[0]}")
+                continue
+            with self._lock:
+                down_for = time.monotonic() - self.opened_at
+                self.opened_at, self.failures = None, 0
+            print(f"Database {self.name} is reachable again after {down_for:.1f}s.")
+            return
+
+    # Re-reads the secret so a failover that moved the writer endpoint is picked up.
+    def _refresh_endpoint(self):
+        if self.credentials_provider is None or time.monotonic() - self._endpoint_refreshed_at < DB_ENDPOINT_REFRESH_INTERVAL:
+            return
+        self._endpoint_refreshed_at = time.monotonic()
+        try:
+            self.credentials_provider.refresh()
+        except Exception as e:
+            print(f"Could not refresh database endpoint from Secrets Manager: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "state": "open" if self.is_open else "closed",
+            "consecutive_failures": self.failures,
+            "open_for_seconds": round(time.monotonic() - self.opened_at, 1) if self.is_open else None,
+            "trips": self.trips,
+        }
+
+# Feeds an engine's connection failures and successful statements into a breaker.
+def attach_breaker(db_engine, breaker: CircuitBreaker, credentials_provider=None):
+    # The first engine attached is the one the probe reconnects (the async engine shares its database).
+    if breaker.engine is None:
+        breaker.engine = db_engine
+        breaker.credentials_provider = credentials_provider
+
+    @event.listens_for(db_engine, "handle_error")
+    def on_error(context):
+        # No connection means the connect itself failed.
+        if context.is_disconnect or context.connection is None:
+            breaker.record_failure()
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def on_success(conn, cursor, statement, parameters, context, executemany):
+        breaker.record_success()
+
+# Retries a read-only function whose first argument is a Session when its connection drops.
+# Only for idempotent reads: the session is rolled back and the whole call is repeated.
+def retry_idempotent(func):
+    @functools.wraps(func)
+    def wrapper(db, *args, **kwargs):
+        for attempt in range(DB_READ_RETRIES + 1):
+            try:
+                return func(db, *args, **kwargs)
+            except DBAPIError as e:
+                if attempt == DB_READ_RETRIES or not is_connection_error(e):
+                    raise
+                db.rollback()
+                breaker = primary_breaker if db.get_bind() is primary_breaker.engine else None
+                if breaker is not None and breaker.is_open:
+                    raise
+                # Full jitter, so retries from many requests do not arrive together.
+                time.sleep(random.uniform(0, DB_RETRY_BASE_DELAY * 2 ** attempt))
+    return wrapper
+
+primary_breaker = CircuitBreaker("primary")
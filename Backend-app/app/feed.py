@@ -0,0 +1,450 @@
+import asyncio
+import os
+import select
+import threading
+from collections import deque
+from decimal import Decimal
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select as sql_select, text
+from starlette.concurrency import run_in_threadpool
+from app import cache, models
+from app.responses import dumps
+
+# --- Product change feed ---
+# Triggers on products append every insert, update and delete to product_changes, in the
+# same transaction as the write and whichever code path made it, with a version taken from
+# the product_feed row. Writers hold that row until they commit, so versions are gap-free
+# and in commit order: a client that has seen version n has seen every change up to n.
+# Each process runs one ChangeHub, while it has subscribers: when woken (or every
+# FEED_POLL_INTERVAL seconds) it reads the new changes once and fans them out to every
+# subscriber's bounded queue. GET /api/products/changes streams them as Server-Sent Events,
+# so a client holds one idle connection instead of polling the product list.
+# The backend decides how hubs learn about writes:
+#   memory   - writes in this process wake its hub at once; other pods' writes arrive
+#              with the next poll (local stand-in)
+#   postgres - the triggers NOTIFY on commit and every pod LISTENs, so all hubs wake at once
+# A subscriber that falls FEED_SUBSCRIBER_BUFFER events behind is disconnected; it
+# reconnects with Last-Event-ID and catches up from the log. Changes older than the
+# product_feed.retention newest are pruned; resuming from before them gets a reset event.
+
+FEED_BACKEND = os.getenv("FEED_BACKEND", "auto").lower()  # auto, memory or postgres
+FEED_SUBSCRIBER_BUFFER = int(os.getenv("FEED_SUBSCRIBER_BUFFER", "256"))
+FEED_MAX_SUBSCRIBERS = int(os.getenv("FEED_MAX_SUBSCRIBERS", "10000"))  # Per process
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "2"))  # Seconds between reads when nothing wakes the hub
+FEED_HEARTBEAT = float(os.getenv("FEED_HEARTBEAT", "15"))  # Keeps proxies from closing idle streams
+FEED_BATCH_SIZE = int(os.getenv("FEED_BATCH_SIZE", "500"))
+FEED_RECENT = int(os.getenv("FEED_RECENT", "1000"))  # Recent changes kept in memory for resumes
+FEED_RETENTION = int(os.getenv("FEED_RETENTION", "100000"))  # Initial product_feed.retention
+FEED_RETRY_MS = int(os.getenv("FEED_RETRY_MS", "1000"))  # Reconnect delay sent to EventSource clients
+FEED_CHANNEL = "product_changes"
+
+OPS = {"INSERT": "created", "UPDATE": "updated", "DELETE": "deleted"}
+
+SQLITE_DATA = (
+    "json_object('id', new.id, 'name', new.name, 'description', new.description, 'price', new.price, "
+    "'image_url', new.image_url, 'image_variants', json(new.image_variants))"
+)
+
+def _sqlite_record(op: str, row: str, data: str) -> str:
+    return (
+        "UPDATE product_feed SET version = version + 1 WHERE id = 1; "
+        f"INSERT INTO product_changes (version, op, product_id, data) SELECT version, '{op}', {row}.id, {data} "
+        "FROM product_feed WHERE id = 1; "
+        "DELETE FROM product_changes WHERE version <= (SELECT version - retention FROM product_feed WHERE id = 1)"
+    )
+
+# Like the Postgres function, the triggers do nothing while there is no product_feed row.
+SQLITE_FEED_ROW = "WHEN EXISTS (SELECT 1 FROM product_feed WHERE id = 1)"
+
+SQLITE_DDL = (
+    "DROP TRIGGER IF EXISTS product_feed_ai",
+    f"CREATE TRIGGER product_feed_ai AFTER INSERT ON products {SQLITE_FEED_ROW} BEGIN "
+    f"{_sqlite_record('INSERT', 'new', SQLITE_DATA)}; END",
+    "DROP TRIGGER IF EXISTS product_feed_au",
+    f"CREATE TRIGGER product_feed_au AFTER UPDATE ON products {SQLITE_FEED_ROW} BEGIN "
+    f"{_sqlite_record('UPDATE', 'new', SQLITE_DATA)}; END",
+    "DROP TRIGGER IF EXISTS product_feed_ad",
+    f"CREATE TRIGGER product_feed_ad AFTER DELETE ON products {SQLITE_FEED_ROW} BEGIN "
+    f"{_sqlite_record('DELETE', 'old', 'NULL')}; END",
+)
+
+POSTGRES_DDL = (
+    "CREATE OR REPLACE FUNCTION product_feed_apply() RETURNS trigger LANGUAGE plpgsql AS $$ "
+    "DECLARE n bigint; head bigint; keep bigint; "
+    "BEGIN "
+    "IF TG_OP = 'DELETE' THEN SELECT count(*) INTO n FROM old_rows; ELSE SELECT count(*) INTO n FROM new_rows; END IF; "
+    "IF n = 0 THEN RETURN NULL; END IF; "
+    # The row lock is held until commit, so the next writer's versions come after ours.
+    "UPDATE product_feed SET version = version + n WHERE id = 1 RETURNING version, retention INTO head, keep; "
+    "IF head IS NULL THEN RETURN NULL; END IF; "
+    "IF TG_OP = 'DELETE' THEN "
+    "INSERT INTO product_changes (version, op, product_id, data) "
+    "SELECT head - n + row_number() OVER (ORDER BY id), TG_OP, id, NULL FROM old_rows; "
+    "ELSE "
+    "INSERT INTO product_changes (version, op, product_id, data) "
+    "SELECT head - n + row_number() OVER (ORDER BY r.id), TG_OP, r.id, to_json(r) FROM new_rows r; "
+    "END IF; "
+    "DELETE FROM product_changes WHERE version <= head - keep; "
+    f"PERFORM pg_notify('{FEED_CHANNEL}', head::text); "
+    "RETURN NULL; "
+    "END $$",
+    "DROP TRIGGER IF EXISTS product_feed_insert ON products",
+    "CREATE TRIGGER product_feed_insert AFTER INSERT ON products "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION product_feed_apply()",
+    "DROP TRIGGER IF EXISTS product_feed_update ON products",
+    "CREATE TRIGGER product_feed_update AFTER UPDATE ON products "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION product_feed_apply()",
+    "DROP TRIGGER IF EXISTS product_feed_delete ON products",
+    "CREATE TRIGGER product_feed_delete AFTER DELETE ON products "
+    "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION product_feed_apply()",
+)
+
+# Installs the triggers and the product_feed row. Safe to run repeatedly.
+def create_feed_triggers(conn):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        statements = POSTGRES_DDL
+    elif dialect == "sqlite":
+        statements = SQLITE_DDL
+    else:
+        return
+    for statement in statements:
+        conn.execute(text(statement))
+    if conn.execute(text("SELECT 1 FROM product_feed WHERE id = 1")).first() is None:
+        head = conn.execute(text("SELECT coalesce(max(version), 0) FROM product_changes")).scalar()
+        conn.execute(models.ProductFeed.__table__.insert().values(id=1, version=head, retention=FEED_RETENTION))
+
+# Empties the change log and puts the product_feed row back at `version`, after a load
+# that ran without the row (see backup.restore). Clients resuming from an older version
+# get a reset event and reload the catalogue.
+def reset(conn, version: int = 0):
+    conn.execute(text("DELETE FROM product_changes"))
+    conn.execute(text("DELETE FROM product_feed"))
+    conn.execute(models.ProductFeed.__table__.insert().values(id=1, version=version, retention=FEED_RETENTION))
+
+changes_table = models.ProductChange.__table__
+
+# The last version handed out, 0 if there have been no changes.
+def head_version(conn) -> int:
+    return conn.execute(text("SELECT version FROM product_feed WHERE id = 1")).scalar() or 0
+
+def _event(row) -> dict:
+    data = row.data
+    if data is not None and data.get("price") is not None:
+        # SQLite stores prices as REAL and JSON drops trailing zeros; match the API's two places.
+        data = dict(data, price=Decimal(str(data["price"])).quantize(Decimal("0.01")))
+    return {"version": row.version, "op": OPS[row.op], "product_id": row.product_id, "product": data}
+
+# Changes after a version, oldest first.
+def read_changes(conn, after: int, limit: int = FEED_BATCH_SIZE) -> list:
+    stmt = sql_select(changes_table).where(changes_table.c.version > after).order_by(changes_table.c.version).limit(limit)
+    return [_event(row) for row in conn.execute(stmt)]
+
+def _load_head() -> int:
+    from app.db import engine
+    with engine.connect() as conn:
+        return head_version(conn)
+
+def _load_changes(after: int, limit: int = FEED_BATCH_SIZE) -> list:
+    from app.db import engine
+    with engine.connect() as conn:
+        return read_changes(conn, after, limit)
+
+# Interface for the cross-pod backend. start() is given a thread-safe wake() to call
+# whenever product_changes may have grown.
+class FeedBackend:
+    def start(self, wake):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    # Called after this process commits a product write.
+    def notify(self):
+        pass
+
+# In-process backend: only this process's writes wake the hub before the next poll.
+class MemoryFeedBackend(FeedBackend):
+    def __init__(self):
+        self._wake = None
+
+    def start(self, wake):
+        self._wake = wake
+
+    def stop(self):
+        self._wake = None
+
+    def notify(self):
+        wake = self._wake
+        if wake is not None:
+            wake()
+
+# Postgres LISTEN/NOTIFY backend. The triggers NOTIFY on commit, so writes from every pod
+# wake every hub. Listens on its own connection, outside the pool, from a thread.
+class PostgresFeedBackend(FeedBackend):
+    def __init__(self, db_engine=None):
+        self.engine = db_engine
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, wake):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(wake,), name="feed-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _listen(self, wake):
+        if self.engine is None:
+            from app.db import engine
+            self.engine = engine
+        while not self._stop.is_set():
+            try:
+                conn = self.engine.raw_connection()
+                # LISTEN state must not go back into the pool.
+                conn.detach()
+                dbapi_conn = conn.driver_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {FEED_CHANNEL}")
+                # Changes committed while we were not listening.
+                wake()
+                try:
+                    while not self._stop.is_set():
+                        if select.select([dbapi_conn], [], [], FEED_POLL_INTERVAL)[0]:
+                            dbapi_conn.poll()
+                            if dbapi_conn.notifies:
+                                dbapi_conn.notifies.clear()
+                                wake()
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"Product feed listener failed, retrying: {e}")
+                self._stop.wait(FEED_POLL_INTERVAL)
+
+def _default_backend() -> FeedBackend:
+    backend = FEED_BACKEND
+    if backend == "auto":
+        from app.db import engine
+        backend = "postgres" if engine.dialect.name == "postgresql" else "memory"
+    return PostgresFeedBackend() if backend == "postgres" else MemoryFeedBackend()
+
+# One client's stream. The queue holds changes not yet sent; None ends the stream.
+class Subscriber:
+    def __init__(self, start: int):
+        self.start = start
+        self.queue = asyncio.Queue(FEED_SUBSCRIBER_BUFFER + 1)  # + 1 for the closing None
+        self.closed = False
+
+    def offer(self, event) -> bool:
+        if self.closed:
+            return True
+        if self.queue.qsize() >= FEED_SUBSCRIBER_BUFFER:
+            return False
+        self.queue.put_nowait(event)
+        return True
+
+    # Drops whatever was not sent yet (the client resumes from the last id it got) and ends the stream.
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class FeedFull(Exception):
+    pass
+
+# Reads new changes once per wake-up and fans them out to this process's subscribers.
+class ChangeHub:
+    def __init__(self, backend: FeedBackend = None):
+        self.backend = backend
+        self.subscribers = set()
+        self.version = None
+        self.recent = deque(maxlen=FEED_RECENT)
+        self.published = 0
+        self.dropped = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._start_lock = None
+
+    # Thread-safe; called by the backend and after local writes.
+    def wake(self):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # The loop has closed
+
+    def notify(self):
+        if self.backend is not None:
+            self.backend.notify()
+
+    async def _ensure_running(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._task is not None and not self._task.done():
+                return
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self.version = await run_in_threadpool(_load_head)
+            self.recent.clear()
+            if self.backend is None:
+                self.backend = _default_backend()
+            self.backend.start(self.wake)
+            self._task = asyncio.create_task(self._run())
+
+    # Registers a subscriber that receives every change after the current version.
+    async def subscribe(self) -> Subscriber:
+        if len(self.subscribers) >= FEED_MAX_SUBSCRIBERS:
+            raise FeedFull()
+        await self._ensure_running()
+        subscriber = Subscriber(self.version)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    # Runs while anyone is subscribed.
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), FEED_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await self._fetch()
+                except Exception as e:
+                    print(f"Product feed read failed, retrying: {e}")
+        finally:
+            self.backend.stop()
+
+    async def _fetch(self):
+        while True:
+            generation = cache.version_generation()
+            events = await run_in_threadpool(_load_changes, self.version)
+            for event in events:
+                self.recent.append(event)
+                for subscriber in list(self.subscribers):
+                    if not subscriber.offer(event):
+                        self.dropped += 1
+                        self.unsubscribe(subscriber)
+                        subscriber.close()
+                self.version = event["version"]
+                self.published += 1
+            if events:
+                cache.remember_version("primary", self.version, generation)
+            if len(events) < FEED_BATCH_SIZE:
+                return
+
+    # Changes in (after, until], from memory when recent enough, otherwise from the log.
+    async def replay(self, after: int, until: int):
+        recent = list(self.recent)
+        if recent and recent[0]["version"] <= after + 1:
+            for event in recent:
+                if after < event["version"] <= until:
+                    yield event
+            return
+        while after < until:
+            events = await run_in_threadpool(_load_changes, after, min(FEED_BATCH_SIZE, until - after))
+            if not events:
+                return
+            for event in events:
+                yield event
+            after = events[-1]["version"]
+
+    # Ends every stream, e.g. at shutdown; clients reconnect elsewhere with Last-Event-ID.
+    def close(self):
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        self.subscribers.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "subscribers": len(self.subscribers),
+            "version": self.version,
+            "published": self.published,
+            "dropped_subscribers": self.dropped,
+        }
+
+hub = ChangeHub()
+
+# Wakes this process's hub after a committed product write.
+def notify():
+    hub.notify()
+
+def stats() -> dict:
+    return hub.stats()
+
+def _message(event: str, version: int, data) -> bytes:
+    return f"id: {version}\nevent: {event}\ndata: ".encode() + dumps(data) + b"\n\n"
+
+async def _close_on_disconnect(request: Request, subscriber: Subscriber):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            subscriber.close()
+            return
+
+# The event stream: a ready (or reset) event, the replayed changes, then live ones.
+# Each change is sent as `event: created|updated|deleted` with its version as the id.
+async def _stream(request: Request, subscriber: Subscriber, since: Optional[int]):
+    # The server does not watch for disconnects while streaming, so do it here.
+    watcher = asyncio.create_task(_close_on_disconnect(request, subscriber))
+    try:
+        yield f"retry: {FEED_RETRY_MS}\n\n".encode()
+        position = subscriber.start if since is None else since
+        if since is not None and since < subscriber.start:
+            async for event in hub.replay(since, subscriber.start):
+                if event["version"] != position + 1:
+                    break  # The changes after `since` have been pruned
+                yield _message(event["op"], event["version"], event)
+                position = event["version"]
+        if position != subscriber.start:
+            # Resuming is impossible (pruned, or a version from another database): reload the
+            # catalogue, then carry on from here.
+            yield _message("reset", subscriber.start, {"version": subscriber.start})
+        elif since is None:
+            yield _message("ready", subscriber.start, {"version": subscriber.start})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            yield _message(event["op"], event["version"], event)
+    finally:
+        watcher.cancel()
+        hub.unsubscribe(subscriber)
+
+# Starts a change stream for a request, resuming after Last-Event-ID (or `since`) if given.
+async def changes_response(request: Request, since: Optional[int] = None) -> StreamingResponse:
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id:
+        try:
+            since = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    try:
+        subscriber = await hub.subscribe()
+    except FeedFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many change feed subscribers")
+    return StreamingResponse(
+        _stream(request, subscriber, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,74 @@
+# Production server: gunicorn -c python:app.gunicorn_conf app.main:app
+#
+# Runs one uvicorn worker process per core of the container's CPU quota, so Python work
+# (bcrypt included) uses every core the pod is given instead of one.
+#
+# Rolling deploys and DR cutovers: on SIGTERM the workers stop accepting connections, let
+# in-flight requests finish for up to GRACEFUL_TIMEOUT seconds, then run the shutdown
+# handlers. Give the pod a preStop sleep of a few seconds, so it leaves the Service endpoints
+# before it stops listening, and a terminationGracePeriodSeconds above the sleep plus
+# GRACEFUL_TIMEOUT.
+#
+# The product cache and its ETags are keyed by product_feed.version in the database, so a
+# write through any worker is seen by every other within CATALOGUE_VERSION_TTL (app/cache.py).
+# Other state stays per worker:
+# the verified token cache, in-memory login rate limits (set a shared backend to keep the
+# limits per pod) and the /metrics counters.
+import os
+from uvicorn.workers import UvicornWorker
+from app.cpu import available_cpus
+
+# WEB_CONCURRENCY overrides the worker count taken from the CPU quota.
+workers = int(os.getenv("WEB_CONCURRENCY", str(available_cpus())))
+worker_class = "app.gunicorn_conf.DrainingWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Workers are async, so this only catches an event loop that has stopped responding.
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# Trust X-Forwarded-For from these addresses (the ingress), so rate limits see real clients.
+# Set it to the load balancer's addresses or subnets, e.g. "10.0.0.0/16"; ranges are
+# resolved by the app (app/admission.py), since uvicorn only matches exact addresses.
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+accesslog = None
+
+# Import the app once in the master, so every worker forks with it loaded and starts at once.
+# Nothing connects to the database at import, and post_fork drops any inherited pool state.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# One worker per core already uses every core, so workers hash passwords and resize images
+# on their own threadpools (bcrypt and Pillow release the GIL) instead of each starting
+# process pools sized to the whole quota.
+# Each worker keeps verified tokens for up to TOKEN_CACHE_TTL, including those of users
+# deleted or with a changed password since; keep that window short.
+if workers > 1:
+    os.environ.setdefault("HASH_WORKERS", "0")
+    os.environ.setdefault("IMAGE_WORKERS", "0")
+    os.environ.setdefault("TOKEN_CACHE_TTL", "30")
+
+# Calibrates BCRYPT_ROUNDS=auto once in the master and passes the cost to the workers
+# through the environment, so they all hash at the same cost and start without timing bcrypt.
+def on_starting(server):
+    if os.getenv("BCRYPT_ROUNDS", "").lower() == "auto":
+        from app.auth.auth import get_bcrypt_rounds
+        os.environ["BCRYPT_ROUNDS"] = str(get_bcrypt_rounds())
+
+def post_fork(server, worker):
+    from app import db, replicas
+    # close=False leaves the master's connections alone instead of closing them from a child.
+    db.engine.dispose(close=False)
+    if db.async_engine is not None:
+        db.async_engine.sync_engine.dispose(close=False)
+    for replica in replicas.replicas:
+        replica.engine.dispose(close=False)
+        if replica.async_engine is not None:
+            replica.async_engine.sync_engine.dispose(close=False)
+
+# Drains in-flight requests for a little less than graceful_timeout before cancelling
+# them, so the shutdown handlers still run before gunicorn kills the worker.
+class DrainingWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "timeout_graceful_shutdown": max(graceful_timeout - 5, 1),
+    }
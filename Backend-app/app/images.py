@@ -0,0 +1,195 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from app import admission, storage
+from app.cpu import available_cpus
+
+# --- Product image pipeline ---
+# Uploads stream straight into the object store. Resized WebP variants are then built on
+# the image workers, and the product's image_url (the IMAGE_DEFAULT_VARIANT) and
+# image_variants are updated once they are all stored, so clients never hotlink an original.
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))  # Larger images are rejected (decompression bombs)
+IMAGE_VARIANTS = os.getenv("IMAGE_VARIANTS", "thumb:160,medium:640,large:1280")  # name:longest edge in pixels
+IMAGE_DEFAULT_VARIANT = os.getenv("IMAGE_DEFAULT_VARIANT", "medium")
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+# Accepted upload types and the extension the original is stored under.
+IMAGE_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+
+# Parses IMAGE_VARIANTS into {name: size}.
+def parse_variants(spec: str) -> dict:
+    variants = {}
+    for item in spec.split(","):
+        name, _, size = item.strip().partition(":")
+        variants[name] = int(size)
+    return variants
+
+VARIANTS = parse_variants(IMAGE_VARIANTS)
+
+# Raised when an image has more than IMAGE_MAX_PIXELS pixels.
+class ImageTooLarge(Exception):
+    pass
+
+# Checks a stored image's dimensions from its header, without decoding it. Raises
+# ImageTooLarge past IMAGE_MAX_PIXELS and ValueError when Pillow cannot read the file.
+def check_image(key: str):
+    from PIL import Image, UnidentifiedImageError
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    with storage.get_store().open(key) as f:
+        try:
+            with Image.open(f) as image:
+                width, height = image.size
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e))
+        except (UnidentifiedImageError, OSError) as e:
+            raise ValueError(str(e))
+    # Pillow only raises past twice MAX_IMAGE_PIXELS and warns below that, so check explicitly.
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(f"{width}x{height} is over {IMAGE_MAX_PIXELS} pixels")
+
+# Builds the WebP variants of a stored original and returns {name: url}, original included.
+# Runs in an image worker process; the store is created there from the same environment.
+def make_variants(original_key: str, prefix: str, variants: dict, quality: int = IMAGE_WEBP_QUALITY) -> dict:
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    store = storage.get_store()
+    largest = max(variants.values())
+    with store.open(original_key) as f:
+        image = Image.open(f)
+        if image.width * image.height > IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(f"{image.width}x{image.height} is over {IMAGE_MAX_PIXELS} pixels")
+        # JPEGs decode at a reduced scale when the largest variant allows, which is much cheaper.
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    urls = {"original": store.url(original_key)}
+    # Largest first, each variant shrunk from the previous one.
+    for name, size in sorted(variants.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=quality)
+        key = f"{prefix}/{name}.webp"
+        store.save(key, out.getvalue(), "image/webp")
+        urls[name] = store.url(key)
+    return urls
+
+# Image executor configuration.
+# Resizing is CPU bound, so it runs in worker processes sized to the CPU quota, like password hashing.
+# IMAGE_WORKERS=0 falls back to the default threadpool.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(available_cpus())))
+IMAGE_QUEUE_SIZE = int(os.getenv("IMAGE_QUEUE_SIZE", str(max(IMAGE_WORKERS, 1) * 16)))
+
+_image_executor = None
+_image_pending = 0
+_image_lock = threading.Lock()
+# Latest upload per product, so a slow older upload cannot overwrite a newer one.
+_latest_upload = {}
+
+# Returns the shared image executor, creating it on first use, from a forkserver like the hashing executor.
+def get_image_executor():
+    global _image_executor
+    if _image_executor is None and IMAGE_WORKERS > 0:
+        with _image_lock:
+            if _image_executor is None:
+                _image_executor = ProcessPoolExecutor(
+                    max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+                )
+    return _image_executor
+
+# Shuts down the image executor, waiting for in-flight jobs.
+def shutdown_image_executor():
+    global _image_executor
+    with _image_lock:
+        executor, _image_executor = _image_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def stats() -> dict:
+    return {"workers": IMAGE_WORKERS, "pending": _image_pending, "queue_size": IMAGE_QUEUE_SIZE}
+
+# Builds the variants of an upload and points the product at them.
+# Runs as a background task after the upload response has been sent.
+async def process_upload(product_id: int, upload_id: str, original_key: str, prefix: str):
+    from app import crud
+    from app.db import SessionLocal
+    global _image_pending
+    try:
+        loop = asyncio.get_running_loop()
+        urls = await loop.run_in_executor(get_image_executor(), make_variants, original_key, prefix, VARIANTS)
+    except Exception as e:
+        print(f"Could not build image variants for product {product_id}: {e}")
+        await run_in_threadpool(storage.get_store().delete, original_key)
+        return
+    finally:
+        with _image_lock:
+            _image_pending -= 1
+    if _latest_upload.get(product_id) != upload_id:
+        return
+    def save():
+        db = SessionLocal()
+        try:
+            return crud.set_product_images(db, product_id, urls.get(IMAGE_DEFAULT_VARIANT, urls["original"]), urls)
+        finally:
+            db.close()
+    try:
+        await run_in_threadpool(save)
+    except Exception as e:
+        print(f"Could not save image variants for product {product_id}: {e}")
+    finally:
+        if _latest_upload.get(product_id) == upload_id:
+            del _latest_upload[product_id]
+
+# Streams an image upload into the store and queues its variants on background_tasks.
+# Raises 415 for other content types, 413 past IMAGE_MAX_BYTES or IMAGE_MAX_PIXELS, 400 when
+# the body is not a readable image and 503 when the image queue is full.
+async def accept_upload(request: Request, product_id: int, background_tasks) -> dict:
+    global _image_pending
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in IMAGE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be one of {', '.join(sorted(IMAGE_TYPES))}",
+        )
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Images are limited to {IMAGE_MAX_BYTES} bytes")
+    if int(request.headers.get("content-length") or 0) > IMAGE_MAX_BYTES:
+        raise too_large
+    with _image_lock:
+        if _image_pending >= IMAGE_QUEUE_SIZE:
+            raise admission.server_busy(retry_after=5)
+        _image_pending += 1
+    queued = False
+    try:
+        upload_id = uuid.uuid4().hex
+        prefix = f"products/{product_id}/{upload_id}"
+        original_key = f"{prefix}/original.{IMAGE_TYPES[content_type]}"
+        store = storage.get_store()
+        try:
+            await store.save_stream(original_key, request.stream(), content_type, IMAGE_MAX_BYTES)
+        except storage.ObjectTooLarge:
+            raise too_large
+        try:
+            await run_in_threadpool(check_image, original_key)
+        except ImageTooLarge:
+            await run_in_threadpool(store.delete, original_key)
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Images are limited to {IMAGE_MAX_PIXELS} pixels",
+            )
+        except ValueError:
+            await run_in_threadpool(store.delete, original_key)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload is not a readable image")
+        _latest_upload[product_id] = upload_id
+        background_tasks.add_task(process_upload, product_id, upload_id, original_key, prefix)
+        queued = True
+    finally:
+        if not queued:
+            with _image_lock:
+                _image_pending -= 1
+    return {"product_id": product_id, "original_url": store.url(original_key), "status": "processing"}
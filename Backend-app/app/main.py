@@ -1,10 +1,16 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from passlib.context import CryptContext
-from .db import SessionLocal, engine, Base
+from .db import engine, Base, ASYNC_DB_ENABLED, async_engine, get_db, get_pool_stats
+from .auth import auth
+from . import admission, cache, crud, failover, feed, images, metrics, migrations, readiness, replicas, storage
+from .api.endpoints import auth as auth_endpoints, products, products_async
 from dotenv import load_dotenv # Keep for local dev, won't be used in K8s with env vars
 
 # Your other routes...
@@ -27,26 +33,6 @@ class UserResponse(BaseModel):
     class Config:
         orm_mode = True # Consider renaming to from_attributes = True for Pydantic v2 to remove warning
 
-# Hash passwords for security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Database session dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-from sqlalchemy import Column, Integer, String
-from sqlalchemy.orm import relationship
-
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
-
 # Initialize the FastAPI app
 app = FastAPI(title="User Authentication API")
 
@@ -74,36 +60,173 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create the database tables if they don't exist
-Base.metadata.create_all(bind=engine)
+# Request and DB metrics, exposed at /metrics. METRICS_SAMPLE_RATE=0 disables them.
+if metrics.METRICS_SAMPLE_RATE > 0:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    if async_engine is not None:
+        metrics.instrument_engine(async_engine.sync_engine)
+    for replica in replicas.replicas:
+        metrics.instrument_engine(replica.engine)
+        if replica.async_engine is not None:
+            metrics.instrument_engine(replica.async_engine.sync_engine)
+
+# Database outages become fast 503s rather than 500s, so clients and the load balancer retry.
+def database_unavailable():
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database unavailable, please retry"},
+        headers={"Retry-After": str(int(failover.DB_BREAKER_PROBE_INTERVAL) or 1)},
+    )
+
+@app.exception_handler(failover.DatabaseUnavailable)
+async def handle_database_unavailable(request, exc):
+    return database_unavailable()
+
+@app.exception_handler(DBAPIError)
+async def handle_database_error(request, exc):
+    if failover.is_connection_error(exc):
+        return database_unavailable()
+    raise exc
+
+# Token auth and product routers.
+# With ASYNC_DB=true the product endpoints run on the async engine.
+app.include_router(auth_endpoints.router, prefix="/api/auth", tags=["Authentication"])
+app.include_router(
+    products_async.router if ASYNC_DB_ENABLED else products.router,
+    prefix="/api/products",
+    tags=["Products"],
+)
+
+# Uploaded product images. With the local store the app serves them itself; in production
+# put them behind the CDN or use IMAGE_STORE=s3.
+if storage.IMAGE_STORE == "local":
+    app.mount(storage.IMAGE_BASE_URL, StaticFiles(directory=storage.IMAGE_STORE_PATH, check_dir=False), name="media")
 
+# Check the schema version on start-up instead of running DDL at import time.
+# DDL only runs when the stored version is missing or old (see app/migrations.py).
+@app.on_event("startup")
+def check_schema():
+    try:
+        print(f"Database schema {migrations.ensure_schema()}.")
+    except Exception as e:
+        print(f"Database schema check failed, continuing: {e}")
+    auth.warm_up_in_background()
+    readiness.start()
+    replicas.start()
+
+# Stop the password hashing workers and the background checkers when the app shuts down.
+@app.on_event("shutdown")
+def shutdown_hash_executor():
+    auth.shutdown_hash_executor()
+    images.shutdown_image_executor()
+    readiness.stop()
+    replicas.stop()
+
+# Ends open change feed streams, so clients reconnect to another pod and resume there.
+@app.on_event("shutdown")
+async def close_change_feed():
+    feed.hub.close()
+
+# Closes pooled async connections so their driver threads do not keep the process alive.
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in replicas.replicas:
+        if replica.async_engine is not None:
+            await replica.async_engine.dispose()
+
+# Liveness: the process is up. Does not touch the database.
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+# Readiness: database, pool and credential status from the background checker.
+# Served from the cached result, so probes never open a session. 503 until ready.
+@app.get("/ready")
+async def ready():
+    result = readiness.status()
+    return JSONResponse(result, status_code=status.HTTP_200_OK if result["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+# Live connection pool statistics, used to size pools per pod under load.
+@app.get("/health/pool")
+async def pool_stats():
+    stats = {"sync": get_pool_stats(engine)}
+    if async_engine is not None:
+        stats["async"] = get_pool_stats(async_engine.sync_engine)
+    for replica in replicas.replicas:
+        stats[f"replica {replica.name}"] = get_pool_stats(replica.engine)
+    return stats
+
+# Primary database circuit breaker state.
+@app.get("/health/db")
+async def database_health():
+    return failover.primary_breaker.stats()
+
+# Admission control state per route class (active, waiting, rejected).
+@app.get("/health/admission")
+async def admission_stats():
+    return {name: limiter.stats() for name, limiter in admission.limiters.items()}
+
+# Health and replication lag of each read replica.
+@app.get("/health/replicas")
+def replica_health():
+    return replicas.replica_status()
+
+# Product read cache counters (hits, misses, evictions).
+@app.get("/health/cache")
+async def cache_stats():
+    return cache.product_cache.stats()
+
+# Image worker pool and its queue.
+@app.get("/health/images")
+async def image_stats():
+    return images.stats()
+
+# Change feed backend, subscribers and the last version fanned out.
+@app.get("/health/feed")
+async def feed_stats():
+    return feed.stats()
+
+# Prometheus scrape endpoint.
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the User Authentication API!"}
 
 # --- User Signup Endpoint ---
-@app.post("/api/v1/users/signup", status_code=status.HTTP_201_CREATED)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
+# DB work runs on the threadpool and bcrypt on the hashing executor,
+# so neither blocks the event loop. The insert skips existing emails itself, so signup is
+# one statement and two concurrent signups for the same email cannot both succeed.
+@app.post("/api/v1/users/signup", status_code=status.HTTP_201_CREATED, dependencies=[Depends(admission.limit_concurrency("auth"))])
+async def signup(user: UserCreate, db: Session = Depends(replicas.get_write_db)):
+    try:
+        hashed_password = await auth.hash_password_async(user.password)
+    except auth.HashingQueueFull:
+        raise admission.server_busy()
+    if await run_in_threadpool(crud.create_user, db, user, hashed_password) is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-
-    hashed_password = pwd_context.hash(user.password)
-    new_user = User(email=user.email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
     return {"message": "User successfully registered!"}
 
 # --- User Login Endpoint ---
-@app.post("/api/v1/users/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+@app.post("/api/v1/users/login", dependencies=[Depends(admission.limit_concurrency("auth"))])
+async def login(request: Request, user: UserLogin, db: Session = Depends(get_db)):
+    admission.check_login_rate(request, user.email)
+    db_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
+    verified, new_hash = False, None
+    try:
+        if db_user is not None:
+            verified, new_hash = await auth.verify_and_update_async(user.password, db_user.hashed_password)
+    except auth.HashingQueueFull:
+        raise admission.server_busy()
+    if verified and new_hash:
+        # Stored at another bcrypt cost; keep the rehash so the next login is at the current cost.
+        await run_in_threadpool(crud.update_password_hash, db, db_user, new_hash)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
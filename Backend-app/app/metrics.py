@@ -0,0 +1,159 @@
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Share of requests that get latency and DB attribution, 0.0 to 1.0.
+# 0 turns metrics off entirely: no middleware and no query hooks are installed.
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+HASHING_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+# Minimal Prometheus metric types. Updates take a lock, so they are safe from the threadpool.
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in sorted(self.values.items())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        lines = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+REGISTRY = []
+
+http_requests = Counter("http_requests_total", "Requests handled, by route and status.", ("method", "route", "status"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled.")
+http_latency = Histogram("http_request_duration_seconds", "Sampled request latency.", ("method", "route"))
+http_db_queries = Histogram("http_request_db_queries", "SQL statements executed per sampled request.", ("method", "route"), QUERY_COUNT_BUCKETS)
+http_db_time = Histogram("http_request_db_seconds", "Time spent in SQL per sampled request.", ("method", "route"))
+db_queries = Counter("db_queries_total", "SQL statements executed by sampled requests.")
+hashing_latency = Histogram("password_hashing_seconds", "Password hash and verify time, including queueing.", ("operation",), HASHING_BUCKETS)
+
+# Renders every metric in the Prometheus text exposition format.
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+# --- Per-request DB attribution ---
+# The middleware puts a [queries, seconds] list in a context variable; the threadpool and
+# the async engine's greenlets inherit the context, so the cursor hooks add to it in place.
+_request_db = ContextVar("request_db", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _request_db.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_db.get()
+    if stats is not None and conn.info.get("query_start"):
+        stats[0] += 1
+        stats[1] += time.perf_counter() - conn.info["query_start"].pop()
+
+# Attributes the engine's queries to the sampled request that issued them.
+def instrument_engine(db_engine):
+    from sqlalchemy import event
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+
+# Records request counts for every request, and latency and DB use for sampled ones.
+# Routes are labelled by their path template, so ids do not create new series.
+class MetricsMiddleware:
+    def __init__(self, app, sample_rate: float = METRICS_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        token = _request_db.set([0, 0.0]) if sampled else None
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            http_requests.inc(*labels, str(status[0]))
+            if sampled:
+                queries, db_seconds = _request_db.get()
+                _request_db.reset(token)
+                http_latency.observe(elapsed, *labels)
+                http_db_queries.observe(queries, *labels)
+                http_db_time.observe(db_seconds, *labels)
+                db_queries.inc(amount=queries)
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from app.db import engine, Base
+from app import models  # Registers the model tables on Base.metadata
+from app import feed, search, stats
+
+# Bump whenever models.py changes in a way that needs DDL.
+SCHEMA_VERSION = 6  # 2: product search indexes, 3: products.image_variants, 4: catalogue stats, 5: change feed,
+                    # 6: SQLite feed triggers skip a missing feed row
+
+# How start-up treats the schema:
+#   auto  - skip DDL if the stored version is current, otherwise create missing tables and stamp it
+#   check - only compare the stored version and log a mismatch; never runs DDL (e.g. DR standby)
+#   off   - do not touch the database at start-up
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "auto").lower()
+
+# Kept outside Base.metadata so create_all on the models never depends on it.
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+# DDL beyond create_all, run after the tables exist: (name, function taking a connection).
+SCHEMA_STEPS = (
+    ("search indexes", search.create_search_indexes),
+    ("stats triggers", stats.create_stats_triggers),
+    ("feed triggers", feed.create_feed_triggers),
+)
+
+# Arbitrary key for the Postgres advisory lock that serialises DDL across pods.
+SCHEMA_LOCK_KEY = 72174001
+
+# Returns the stored schema version, or None if the database has never been stamped.
+def get_schema_version(conn):
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.execute(select(schema_version.c.version).order_by(schema_version.c.version.desc())).scalar()
+
+# create_all only creates missing tables, so columns and indexes added to existing models
+# are added here. New columns must be nullable.
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# Brings the schema up to SCHEMA_VERSION without dropping anything.
+# Returns "current", "created", "partial", "outdated", "newer" or "skipped".
+def ensure_schema(db_engine=engine, mode: str = DB_SCHEMA_MODE) -> str:
+    if mode == "off":
+        return "skipped"
+    with db_engine.connect() as conn:
+        version = get_schema_version(conn)
+    if version == SCHEMA_VERSION:
+        return "current"
+    if version is not None and version > SCHEMA_VERSION:
+        print(f"Database schema version {version} is newer than this build ({SCHEMA_VERSION}); leaving it alone.")
+        return "newer"
+    if mode == "check":
+        print(f"Database schema version {version} does not match {SCHEMA_VERSION}; DDL is disabled in check mode.")
+        return "outdated"
+    with db_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        # Another pod may have finished while we waited for the lock.
+        if get_schema_version(conn) == SCHEMA_VERSION:
+            return "current"
+        Base.metadata.create_all(bind=conn)
+        add_missing_columns(conn)
+        version_metadata.create_all(bind=conn)
+        # Each step has its own savepoint, so one failing (search indexes need pg_trgm) keeps
+        # the tables and the other steps; the version is only stamped once all succeed, so
+        # the failed ones are retried on the next start-up.
+        failed = []
+        for step, create in SCHEMA_STEPS:
+            try:
+                with conn.begin_nested():
+                    create(conn)
+            except SQLAlchemyError as e:
+                failed.append(step)
+                print(f"Could not create product {step}, will retry on next start-up: {e}")
+        if failed:
+            return "partial"
+        conn.execute(schema_version.delete())
+        conn.execute(schema_version.insert().values(version=SCHEMA_VERSION, applied_at=datetime.now(timezone.utc)))
+    return "created"
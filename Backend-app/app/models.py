@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DECIMAL
-from app.database import Base
+from sqlalchemy import BigInteger, Column, Integer, String, DECIMAL, JSON
+from app.db import Base
 
 # SQLAlchemy model for the 'users' table.
 class User(Base):
@@ -16,8 +16,9 @@ class Product(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     description = Column(String)
-    price = Column(DECIMAL(10, 2))
+    price = Column(DECIMAL(10, 2), index=True)  # Indexed so min/max price are index lookups
     image_url = Column(String)
+    image_variants = Column(JSON)  # Variant name -> URL, written by the image pipeline
 
 # File: app/schemas.py
 from pydantic import BaseModel, EmailStr
@@ -63,4 +64,40 @@ class TokenRequest(BaseModel):
 # Pydantic schema for the token response.
 class Token(BaseModel):
     access_token: str
-    token_type: str
\ No newline at end of file
+    token_type: str
+
+# Single-row summary of the products table, kept current by triggers (see app/stats.py).
+class ProductStats(Base):
+    __tablename__ = "product_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    product_count = Column(BigInteger, nullable=False, default=0)
+    price_count = Column(BigInteger, nullable=False, default=0)  # Products with a price
+    price_sum_cents = Column(BigInteger, nullable=False, default=0)
+    min_price = Column(DECIMAL(10, 2))
+    max_price = Column(DECIMAL(10, 2))
+    bucket_width = Column(DECIMAL(10, 2), nullable=False)
+
+# Product count per price bucket: bucket n holds prices in [n * width, (n + 1) * width).
+class ProductPriceBucket(Base):
+    __tablename__ = "product_price_buckets"
+
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    product_count = Column(BigInteger, nullable=False, default=0)
+
+# Head of the product change feed: the last version handed out (see app/feed.py).
+class ProductFeed(Base):
+    __tablename__ = "product_feed"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+    retention = Column(BigInteger, nullable=False)  # Changes kept in product_changes
+
+# One change to a product per version, written by triggers on products.
+class ProductChange(Base):
+    __tablename__ = "product_changes"
+
+    version = Column(BigInteger, primary_key=True, autoincrement=False)
+    op = Column(String, nullable=False)  # INSERT, UPDATE or DELETE
+    product_id = Column(Integer, nullable=False)
+    data = Column(JSON)  # The product after the change; null for deletes
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from sqlalchemy import text
+from app import failover
+from app.db import engine, credentials_provider, get_pool_stats
+
+# --- Readiness ---
+# A background thread checks the database every READY_CHECK_INTERVAL seconds and stores the
+# result; /ready only reads it, so probes never open a session however often kubelets call.
+READY_CHECK_INTERVAL = float(os.getenv("READY_CHECK_INTERVAL", "5"))
+READY_QUERY_TIMEOUT_MS = float(os.getenv("READY_QUERY_TIMEOUT_MS", "1000"))  # Slower checks count as not ready
+
+_status = {"ready": False, "reason": "starting", "checked_at": None}
+_stop = threading.Event()
+_thread = None
+
+def _credentials_status() -> str:
+    if credentials_provider is None:
+        return "environment"
+    return "loaded" if credentials_provider.is_loaded() else "not loaded"
+
+# Runs one check and returns its result.
+def check() -> dict:
+    result = {"checked_at": time.time(), "credentials": _credentials_status(), "pool": get_pool_stats(engine)}
+    if failover.primary_breaker.is_open:
+        # Leave reconnecting to the breaker's probe instead of piling on a dead endpoint.
+        result.update(ready=False, reason="database circuit breaker open", db_latency_ms=None)
+        return result
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        result.update(ready=False, reason=f"database unreachable: {str(e).splitlines()[0]}", db_latency_ms=None)
+        return result
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    result["db_latency_ms"] = latency_ms
+    if latency_ms > READY_QUERY_TIMEOUT_MS:
+        result.update(ready=False, reason=f"database check took {latency_ms} ms")
+    else:
+        result.update(ready=True, reason=None)
+    return result
+
+def _run():
+    global _status
+    while not _stop.is_set():
+        try:
+            _status = check()
+        except Exception as e:
+            _status = {"ready": False, "reason": f"readiness check failed: {e}", "checked_at": time.time()}
+        _stop.wait(READY_CHECK_INTERVAL)
+
+# Starts the background checker; the first check runs at once.
+def start():
+    global _thread
+    if _thread is None:
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="readiness-checker", daemon=True)
+        _thread.start()
+
+def stop():
+    global _thread
+    _stop.set()
+    _thread = None
+
+# Latest readiness. An open breaker overrides a passing check straight away.
+def status() -> dict:
+    current = _status
+    if current["ready"] and failover.primary_breaker.is_open:
+        return dict(current, ready=False, reason="database circuit breaker open")
+    return current
@@ -0,0 +1,222 @@
+import itertools
+import os
+import threading
+import time
+from fastapi import Request, Response
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.failover import primary_breaker
+from app.db import (
+    SessionLocal, engine, credentials_provider, get_connect_args, get_pool_args, attach_credentials, DB_ECHO,
+    ASYNC_DB_ENABLED, AsyncSessionLocal, to_async_url,
+)
+
+# --- Read replicas ---
+# Read-only endpoints take their session from get_read_db, which picks a healthy replica
+# whose replication lag is under DB_REPLICA_MAX_LAG, and falls back to the primary otherwise.
+# A background thread probes health and lag every DB_REPLICA_CHECK_INTERVAL seconds; requests
+# only read the stored result, so a dead replica never holds one up for a connect timeout.
+# Writes go through get_write_db, which also pins the caller's reads to the primary for
+# DB_REPLICA_STICKY_SECONDS with a cookie, so users always see their own writes.
+# With ASYNC_DB=true each replica also gets an async engine, and the async product routes use
+# get_async_read_db / get_async_write_db the same way.
+# Sessions record which backend they read from, so the product cache keeps replica and
+# primary results apart, and results from a replica lagging over DB_REPLICA_CACHE_MAX_LAG
+# are not cached at all.
+#
+#   DB_REPLICA_URLS   comma-separated URLs, e.g. two local databases for testing
+#   DB_REPLICA_HOSTS  comma-separated host[:port] that share the primary's Secrets Manager login
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))  # Seconds
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2"))  # Seconds between health/lag probes
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "10"))
+DB_REPLICA_CACHE_MAX_LAG = float(os.getenv("DB_REPLICA_CACHE_MAX_LAG", "1"))  # Seconds
+
+STICKY_COOKIE = "db_primary_until"
+
+# Seconds since the last replayed transaction; 0 when the server is not in recovery or has
+# replayed everything it received, so a caught-up replica of an idle primary shows no lag.
+POSTGRES_LAG_QUERY = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+# One replica with its last probed health and lag.
+class Replica:
+    def __init__(self, name: str, db_engine, async_engine=None):
+        self.name = name
+        self.engine = db_engine
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+        self.async_engine = async_engine
+        self.AsyncSessionLocal = None
+        if async_engine is not None:
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+            self.AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+    # Checks that the replica answers and measures its lag. Runs on the probe thread.
+    def refresh(self):
+        try:
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    self.lag = float(conn.execute(text(POSTGRES_LAG_QUERY)).scalar())
+                else:
+                    # Local stand-ins have no replication; only check they answer.
+                    conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            self.healthy = self.lag <= DB_REPLICA_MAX_LAG
+            self.error = None if self.healthy else f"lag {self.lag:.1f}s over {DB_REPLICA_MAX_LAG}s"
+        except Exception as e:
+            was_healthy = self.healthy or self.checked_at is None
+            self.healthy, self.error = False, str(e).splitlines()[0]
+            if was_healthy:
+                print(f"Read replica {self.name} is unavailable, reading from the primary: {self.error}")
+        finally:
+            self.checked_at = time.time()
+
+    def status(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "lag_seconds": self.lag, "error": self.error, "checked_at": self.checked_at}
+
+def _create_replica_engine(url: str):
+    return create_engine(url, connect_args=get_connect_args(url), echo=DB_ECHO, **get_pool_args(url))
+
+# The async engine for a replica, or None when async mode is off.
+def _create_async_replica_engine(url: str):
+    if not ASYNC_DB_ENABLED:
+        return None
+    from sqlalchemy.ext.asyncio import create_async_engine
+    url = to_async_url(url)
+    return create_async_engine(
+        url, connect_args=get_connect_args(url, async_driver=True), echo=DB_ECHO, **get_pool_args(url, async_driver=True),
+    )
+
+def _build_replicas():
+    result = []
+    for url in DB_REPLICA_URLS:
+        result.append(Replica(url.split("@")[-1], _create_replica_engine(url), _create_async_replica_engine(url)))
+    for host in DB_REPLICA_HOSTS:
+        if credentials_provider is None:
+            raise RuntimeError("DB_REPLICA_HOSTS needs Secrets Manager credentials; use DB_REPLICA_URLS with DATABASE_URL")
+        name, _, port = host.partition(":")
+        port = int(port) if port else None
+        db_engine = _create_replica_engine("postgresql+psycopg2://")
+        attach_credentials(db_engine, credentials_provider, host=name, port=port)
+        async_engine = _create_async_replica_engine("postgresql+psycopg2://")
+        if async_engine is not None:
+            attach_credentials(async_engine.sync_engine, credentials_provider, host=name, port=port)
+        result.append(Replica(host, db_engine, async_engine))
+    return result
+
+replicas = _build_replicas()
+_round_robin = itertools.count()
+_stop = threading.Event()
+_thread = None
+
+def _run():
+    while not _stop.is_set():
+        for replica in replicas:
+            replica.refresh()
+        _stop.wait(DB_REPLICA_CHECK_INTERVAL)
+
+# Starts the background prober; the first probe runs at once. Until it has run,
+# reads go to the primary.
+def start():
+    global _thread
+    if replicas and _thread is None:
+        _stop.clear()
+        _thread = threading.Thread(target=_run, name="replica-prober", daemon=True)
+        _thread.start()
+
+def stop():
+    global _thread
+    _stop.set()
+    _thread = None
+
+# Returns the next healthy replica, or None to use the primary.
+def choose_replica():
+    if not replicas:
+        return None
+    start = next(_round_robin)
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        if replica.healthy:
+            return replica
+    return None
+
+# Whether the request carries a read-your-writes cookie that has not expired.
+def reads_pinned_to_primary(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+# Dependency for read-only endpoints: a replica session when one is healthy and the
+# caller has not written recently, otherwise a primary session.
+def get_read_db(request: Request):
+    replica = None if reads_pinned_to_primary(request) else choose_replica()
+    if replica is None:
+        primary_breaker.check()
+    db = replica.SessionLocal() if replica else SessionLocal()
+    db.info["backend"] = replica.name if replica else "primary"
+    db.info["cacheable"] = replica is None or replica.lag <= DB_REPLICA_CACHE_MAX_LAG
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Async variant of get_read_db, for the async product routes.
+async def get_async_read_db(request: Request):
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database mode is disabled. Set ASYNC_DB=true to enable it.")
+    replica = None if reads_pinned_to_primary(request) else choose_replica()
+    if replica is None:
+        primary_breaker.check()
+    async with (replica.AsyncSessionLocal() if replica else AsyncSessionLocal()) as db:
+        db.info["backend"] = replica.name if replica else "primary"
+        db.info["cacheable"] = replica is None or replica.lag <= DB_REPLICA_CACHE_MAX_LAG
+        yield db
+
+# Engine for long read-only work that manages its own connection, such as exports.
+def get_read_engine():
+    replica = choose_replica()
+    return replica.engine if replica else engine
+
+# Sets the cookie that keeps this client's reads on the primary, when there are replicas.
+def _pin_reads_to_primary(response: Response):
+    if replicas:
+        response.set_cookie(
+            STICKY_COOKIE,
+            str(int(time.time()) + DB_REPLICA_STICKY_SECONDS),
+            max_age=DB_REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+
+# Dependency for writes: a primary session, plus the cookie that keeps this client's
+# reads on the primary until replicas have caught up.
+def get_write_db(response: Response):
+    _pin_reads_to_primary(response)
+    primary_breaker.check()
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Async variant of get_write_db.
+async def get_async_write_db(response: Response):
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database mode is disabled. Set ASYNC_DB=true to enable it.")
+    _pin_reads_to_primary(response)
+    primary_breaker.check()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Replica health for /health/replicas, as of the last probe.
+def replica_status() -> list:
+    return [replica.status() for replica in replicas]
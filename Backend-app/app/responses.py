@@ -0,0 +1,21 @@
+from decimal import Decimal
+import orjson
+from starlette.responses import Response
+
+# Encodes values orjson does not know about. Decimals keep their exact digits as strings.
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+# JSON response encoded with orjson.
+# Returning it from a handler skips FastAPI's response_model validation and jsonable_encoder,
+# so only use it for content that is already in response shape (e.g. crud row dicts).
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Dict, List, Optional
 from decimal import Decimal
 
 # Pydantic schema for creating a user.
@@ -29,10 +29,64 @@ class ProductResponse(BaseModel):
     description: str
     price: Decimal
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
 
     class Config:
         from_attributes = True
 
+# Pydantic schema for a cursor-paginated page of products.
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
+
+# Pydantic schema for a product search hit; higher rank is more relevant.
+class ProductSearchResult(ProductResponse):
+    rank: float
+
+# Pydantic schema for a page of product search results.
+class ProductSearchPage(BaseModel):
+    items: List[ProductSearchResult]
+    next_cursor: Optional[str] = None
+
+# Pydantic schema for one item of a bulk product update.
+class ProductBulkUpdate(ProductCreate):
+    id: int
+
+# Pydantic schema for an item that was rejected by a bulk operation.
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+# Pydantic schema for the result of a bulk operation.
+# ids lists the affected product ids in input order.
+class BulkResult(BaseModel):
+    ids: List[int]
+    errors: List[BulkItemError]
+
+# Pydantic schema for one price histogram bucket, covering [min_price, max_price).
+class PriceBucket(BaseModel):
+    min_price: Decimal
+    max_price: Decimal
+    product_count: int
+
+# Pydantic schema for the catalogue statistics.
+# priced_count counts the products that have a price; min/max/avg cover those.
+class ProductStats(BaseModel):
+    product_count: int
+    priced_count: int
+    min_price: Optional[Decimal] = None
+    max_price: Optional[Decimal] = None
+    avg_price: Optional[Decimal] = None
+    bucket_width: Optional[Decimal] = None
+    price_buckets: Optional[List[PriceBucket]] = None
+
+# Pydantic schema for an accepted product image upload.
+# Variants are generated in the background; the product's image fields update when they are ready.
+class ImageUpload(BaseModel):
+    product_id: int
+    original_url: str
+    status: str
+
 # Pydantic schema for the login request.
 class TokenRequest(BaseModel):
     email: EmailStr
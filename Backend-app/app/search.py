@@ -0,0 +1,108 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app import crud, models
+from app.failover import retry_idempotent
+
+# --- Product search ---
+# Postgres: a GIN index over a tsvector of name + description for ranked full-text
+# matching, plus a pg_trgm GIN index on name so misspelled names still match.
+# SQLite (local stand-in): an external-content FTS5 table kept in sync by triggers.
+# Results are ordered by (rank, id) descending and paged with a keyset cursor.
+
+# Must match the indexed expression exactly for Postgres to use ix_products_search.
+SEARCH_DOCUMENT = "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_products_search ON products USING GIN ({SEARCH_DOCUMENT})",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (name gin_trgm_ops)",
+)
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    "name, description, content='products', content_rowid='id', tokenize='unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN "
+    "INSERT INTO products_fts(products_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    # Indexes any rows that existed before the table was created.
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+)
+
+COLUMNS = ("id", "name", "description", "price", "image_url", "rank")
+
+# Creates the search indexes for the connection's database. Safe to run repeatedly.
+def create_search_indexes(conn):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        statements = POSTGRES_DDL
+    elif dialect == "sqlite":
+        if conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'")).first():
+            return
+        statements = SQLITE_DDL
+    else:
+        return
+    for statement in statements:
+        conn.execute(text(statement))
+
+def _postgres_query():
+    return (
+        "SELECT p.id, p.name, p.description, p.price, p.image_url, "
+        f"(ts_rank({SEARCH_DOCUMENT}, websearch_to_tsquery('english', :q)) + similarity(name, :q))::float8 AS rank "
+        "FROM products p "
+        f"WHERE {SEARCH_DOCUMENT} @@ websearch_to_tsquery('english', :q) OR name % :q"
+    )
+
+def _sqlite_query():
+    return (
+        "SELECT p.id, p.name, p.description, p.price, p.image_url, -bm25(products_fts) AS rank "
+        "FROM products_fts JOIN products p ON p.id = products_fts.rowid "
+        "WHERE products_fts MATCH :q"
+    )
+
+# Turns free text into an FTS5 query: every word must match, as a prefix.
+def to_fts5_query(q: str) -> str:
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"*' for word in words)
+
+# Searches products by relevance. Returns (rows as dicts, next cursor or None).
+@retry_idempotent
+def search_products(db: Session, q: str, after: str = "", limit: int = 20):
+    limit = max(1, min(limit, crud.MAX_PAGE_SIZE))
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        inner, params = _postgres_query(), {"q": q}
+    elif dialect == "sqlite":
+        fts_query = to_fts5_query(q)
+        if not fts_query:
+            return [], None
+        inner, params = _sqlite_query(), {"q": fts_query}
+    else:
+        raise NotImplementedError(f"Product search is not supported on {dialect}")
+
+    sql = f"SELECT {', '.join(COLUMNS)} FROM ({inner}) ranked"
+    if after:
+        after_rank, after_id = decode_search_cursor(after)
+        sql += " WHERE rank < :after_rank OR (rank = :after_rank AND id < :after_id)"
+        params.update(after_rank=after_rank, after_id=after_id)
+    sql += " ORDER BY rank DESC, id DESC LIMIT :limit"
+    params["limit"] = limit + 1
+
+    stmt = text(sql).columns(price=models.Product.price.type)
+    rows = [dict(zip(COLUMNS, row)) for row in db.execute(stmt, params)]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = crud.encode_cursor_value({"rank": last["rank"], "id": last["id"]})
+    return rows[:limit], next_cursor
+
+def decode_search_cursor(token: str):
+    value = crud.decode_cursor_value(token)
+    try:
+        return float(value["rank"]), int(value["id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
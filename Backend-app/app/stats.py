@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import sys
+from decimal import Decimal
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from app import models
+from app.failover import retry_idempotent
+
+# --- Catalogue statistics ---
+# product_stats holds the product count, the price sum in cents and the min/max price;
+# product_price_buckets holds the product count per price bucket. Triggers on products
+# update both in the same transaction as every insert, update and delete, whichever code
+# path (single writes, bulk endpoints, restores) made it, so reading the stats is one row.
+# min/max are re-read from ix_products_price, which is an index lookup at either end.
+#   Postgres: statement-level triggers over transition tables, so a bulk insert updates
+#             the summary once per statement rather than once per row.
+#   SQLite (local stand-in): row-level triggers.
+# Writes to products serialise on the summary row until they commit.
+# `python -m app.stats rebuild` recomputes everything, e.g. after loading with triggers off.
+
+STATS_PRICE_BUCKET_WIDTH = Decimal(os.getenv("STATS_PRICE_BUCKET_WIDTH", "10"))
+
+# Bucket index of a price in SQL. SQLite has no floor() by default, so negative prices
+# that are not on a bucket boundary are moved down one bucket by hand.
+def _bucket_sql(dialect: str, price: str, width: str) -> str:
+    if dialect == "postgresql":
+        return f"floor({price} / {width})::bigint"
+    truncated = f"CAST({price} / {width} AS INTEGER)"
+    return f"({truncated} - ({price} < 0 AND {truncated} * {width} <> {price}))"
+
+MIN_MAX_SQL = (
+    "UPDATE product_stats SET min_price = (SELECT min(price) FROM products), "
+    "max_price = (SELECT max(price) FROM products) WHERE id = 1"
+)
+
+def _sqlite_apply(row: str, sign: str) -> str:
+    cents = f"coalesce(CAST(round({row}.price * 100) AS INTEGER), 0)"
+    bucket = _bucket_sql("sqlite", f"{row}.price", "bucket_width")
+    statements = [
+        f"UPDATE product_stats SET product_count = product_count {sign} 1, "
+        f"price_count = price_count {sign} ({row}.price IS NOT NULL), "
+        f"price_sum_cents = price_sum_cents {sign} {cents} WHERE id = 1",
+    ]
+    if sign == "+":
+        statements.append(
+            f"INSERT INTO product_price_buckets (bucket, product_count) SELECT {bucket}, 1 FROM product_stats "
+            f"WHERE id = 1 AND {row}.price IS NOT NULL "
+            "ON CONFLICT (bucket) DO UPDATE SET product_count = product_count + 1"
+        )
+    else:
+        statements.append(
+            "UPDATE product_price_buckets SET product_count = product_count - 1 "
+            f"WHERE {row}.price IS NOT NULL AND bucket = (SELECT {bucket} FROM product_stats WHERE id = 1)"
+        )
+    return "; ".join(statements)
+
+SQLITE_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS product_stats_ai AFTER INSERT ON products BEGIN "
+    f"{_sqlite_apply('new', '+')}; {MIN_MAX_SQL}; END",
+    "CREATE TRIGGER IF NOT EXISTS product_stats_ad AFTER DELETE ON products BEGIN "
+    f"{_sqlite_apply('old', '-')}; {MIN_MAX_SQL}; END",
+    "CREATE TRIGGER IF NOT EXISTS product_stats_au AFTER UPDATE OF price ON products BEGIN "
+    f"{_sqlite_apply('old', '-')}; {_sqlite_apply('new', '+')}; {MIN_MAX_SQL}; END",
+)
+
+def _postgres_apply(rows: str, sign: str) -> str:
+    statements = [
+        f"UPDATE product_stats s SET product_count = s.product_count {sign} d.n, "
+        f"price_count = s.price_count {sign} d.priced, price_sum_cents = s.price_sum_cents {sign} d.cents "
+        "FROM (SELECT count(*) AS n, count(price) AS priced, "
+        f"coalesce(sum(round(price * 100)), 0)::bigint AS cents FROM {rows}) d WHERE s.id = 1;",
+    ]
+    bucket = _bucket_sql("postgresql", "price", "width")
+    if sign == "+":
+        statements.append(
+            f"INSERT INTO product_price_buckets (bucket, product_count) SELECT {bucket}, count(*) FROM {rows} "
+            "WHERE price IS NOT NULL GROUP BY 1 "
+            "ON CONFLICT (bucket) DO UPDATE SET product_count = product_price_buckets.product_count + EXCLUDED.product_count;"
+        )
+    else:
+        statements.append(
+            "UPDATE product_price_buckets b SET product_count = b.product_count - d.n "
+            f"FROM (SELECT {bucket} AS bucket, count(*) AS n FROM {rows} WHERE price IS NOT NULL GROUP BY 1) d "
+            "WHERE b.bucket = d.bucket;"
+        )
+    return " ".join(statements)
+
+POSTGRES_DDL = (
+    "CREATE OR REPLACE FUNCTION product_stats_apply() RETURNS trigger LANGUAGE plpgsql AS $$ "
+    "DECLARE width numeric; "
+    "BEGIN "
+    # Locking the summary row first orders concurrent writers, so bucket updates cannot deadlock.
+    "SELECT bucket_width INTO width FROM product_stats WHERE id = 1 FOR UPDATE; "
+    "IF width IS NULL THEN RETURN NULL; END IF; "
+    f"IF TG_OP <> 'INSERT' THEN {_postgres_apply('old_rows', '-')} END IF; "
+    f"IF TG_OP <> 'DELETE' THEN {_postgres_apply('new_rows', '+')} END IF; "
+    f"{MIN_MAX_SQL}; "
+    "RETURN NULL; "
+    "END $$",
+    "DROP TRIGGER IF EXISTS product_stats_insert ON products",
+    "CREATE TRIGGER product_stats_insert AFTER INSERT ON products "
+    "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION product_stats_apply()",
+    "DROP TRIGGER IF EXISTS product_stats_update ON products",
+    "CREATE TRIGGER product_stats_update AFTER UPDATE ON products "
+    "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION product_stats_apply()",
+    "DROP TRIGGER IF EXISTS product_stats_delete ON products",
+    "CREATE TRIGGER product_stats_delete AFTER DELETE ON products "
+    "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION product_stats_apply()",
+)
+
+# Installs the triggers, and fills the summary if it has never been built.
+def create_stats_triggers(conn):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        statements = POSTGRES_DDL
+    elif dialect == "sqlite":
+        statements = SQLITE_DDL
+    else:
+        return
+    for statement in statements:
+        conn.execute(text(statement))
+    if conn.execute(text("SELECT 1 FROM product_stats WHERE id = 1")).first() is None:
+        rebuild(conn)
+
+# Recomputes the summary and the buckets from the products table.
+# On Postgres, writes to products wait until it commits; reads carry on.
+def rebuild(conn, bucket_width: Decimal = None):
+    dialect = conn.dialect.name
+    if bucket_width is None:
+        bucket_width = conn.execute(text("SELECT bucket_width FROM product_stats WHERE id = 1")).scalar() or STATS_PRICE_BUCKET_WIDTH
+    if dialect == "postgresql":
+        conn.execute(text("LOCK TABLE products IN SHARE MODE"))
+    count, priced, cents, min_price, max_price = conn.execute(text(
+        "SELECT count(*), count(price), coalesce(sum(round(price * 100)), 0), min(price), max(price) FROM products"
+    )).first()
+    conn.execute(text("DELETE FROM product_stats"))
+    conn.execute(text("DELETE FROM product_price_buckets"))
+    conn.execute(models.ProductStats.__table__.insert().values(
+        id=1, product_count=count, price_count=priced, price_sum_cents=int(cents),
+        min_price=min_price, max_price=max_price, bucket_width=bucket_width,
+    ))
+    bucket = _bucket_sql(dialect, "price", ":width")
+    conn.execute(text(
+        f"INSERT INTO product_price_buckets (bucket, product_count) SELECT {bucket}, count(*) FROM products "
+        "WHERE price IS NOT NULL GROUP BY 1"
+    ).bindparams(bindparam("width", bucket_width, type_=models.ProductStats.bucket_width.type)))
+
+def _money(value) -> Decimal:
+    return None if value is None else Decimal(str(value)).quantize(Decimal("0.01"))
+
+# Reads the catalogue statistics, with the price histogram when buckets is true.
+# Returns None if the summary has not been built yet.
+@retry_idempotent
+def get_stats(db: Session, buckets: bool = False):
+    row = db.execute(text(
+        "SELECT product_count, price_count, price_sum_cents, min_price, max_price, bucket_width FROM product_stats WHERE id = 1"
+    )).first()
+    if row is None:
+        return None
+    count, priced, cents, min_price, max_price, width = row
+    result = {
+        "product_count": count,
+        "priced_count": priced,
+        "min_price": _money(min_price),
+        "max_price": _money(max_price),
+        "avg_price": _money(Decimal(cents) / priced / 100) if priced else None,
+    }
+    if buckets:
+        width = _money(width)
+        result["bucket_width"] = width
+        result["price_buckets"] = [
+            {"min_price": bucket * width, "max_price": (bucket + 1) * width, "product_count": bucket_count}
+            for bucket, bucket_count in db.execute(text(
+                "SELECT bucket, product_count FROM product_price_buckets WHERE product_count > 0 ORDER BY bucket"
+            ))
+        ]
+    return result
+
+# Command line:
+#   python -m app.stats show [--buckets]
+#   python -m app.stats rebuild [--bucket-width 5]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or rebuild the catalogue statistics.")
+    parser.add_argument("command", choices=("show", "rebuild"))
+    parser.add_argument("--buckets", action="store_true", help="include the price histogram")
+    parser.add_argument("--bucket-width", type=Decimal, help="rebuild with a new price bucket width")
+    args = parser.parse_args(argv)
+    from app.db import engine, SessionLocal
+    if args.command == "rebuild":
+        with engine.begin() as conn:
+            rebuild(conn, args.bucket_width)
+    db = SessionLocal()
+    try:
+        json.dump(get_stats(db, buckets=args.buckets or args.command == "rebuild"), sys.stdout, indent=2, default=str)
+        sys.stdout.write("\n")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+from starlette.concurrency import run_in_threadpool
+
+# --- Object storage for uploaded files ---
+# IMAGE_STORE picks the backend:
+#   local - files under IMAGE_STORE_PATH, served by the app at IMAGE_BASE_URL
+#   s3    - objects in IMAGE_S3_BUCKET, streamed with multipart uploads; set IMAGE_BASE_URL
+#           to the bucket's CDN origin, otherwise the bucket's S3 URL is used
+# Uploads are written chunk by chunk, so a request body is never held in memory whole.
+IMAGE_STORE = os.getenv("IMAGE_STORE", "local").lower()
+IMAGE_STORE_PATH = os.getenv("IMAGE_STORE_PATH", "media")
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "/media" if IMAGE_STORE == "local" else "")
+IMAGE_S3_BUCKET = os.getenv("IMAGE_S3_BUCKET")
+IMAGE_S3_PREFIX = os.getenv("IMAGE_S3_PREFIX", "")
+IMAGE_S3_REGION = os.getenv("AWS_REGION", "eu-west-2")
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))  # S3 needs at least 5 MiB per part
+
+# Raised when a stream passes its size limit. Nothing is left behind in the store.
+class ObjectTooLarge(Exception):
+    pass
+
+# Interface for object stores.
+class ObjectStore:
+    # Writes an async iterable of byte chunks to key. Returns the number of bytes written.
+    async def save_stream(self, key: str, chunks, content_type: str, max_bytes: int) -> int:
+        raise NotImplementedError
+
+    # Writes a small object in one call (used for generated variants).
+    def save(self, key: str, data: bytes, content_type: str):
+        raise NotImplementedError
+
+    # Opens an object for reading as a binary file.
+    def open(self, key: str):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+# Stores objects as files. Writes go to a .part file that is renamed into place once complete.
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root: str = IMAGE_STORE_PATH, base_url: str = IMAGE_BASE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    async def save_stream(self, key: str, chunks, content_type: str, max_bytes: int) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = 0
+        f = await run_in_threadpool(open, path + ".part", "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ObjectTooLarge(f"Object is larger than {max_bytes} bytes")
+                if chunk:
+                    await run_in_threadpool(f.write, chunk)
+            await run_in_threadpool(f.close)
+            os.replace(path + ".part", path)
+        except BaseException:
+            f.close()
+            os.remove(path + ".part")
+            raise
+        return size
+
+    def save(self, key: str, data: bytes, content_type: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+
+    def open(self, key: str):
+        return open(self._path(key), "rb")
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+# Stores objects in S3. Streams are sent as multipart uploads of S3_PART_SIZE, so at most one
+# part is buffered per upload; bodies smaller than one part go up with a single PutObject.
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket: str = IMAGE_S3_BUCKET, prefix: str = IMAGE_S3_PREFIX, base_url: str = IMAGE_BASE_URL, region: str = IMAGE_S3_REGION):
+        if not bucket:
+            raise ValueError("IMAGE_S3_BUCKET must be set when IMAGE_STORE=s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.base_url = (base_url or f"https://{bucket}.s3.{region}.amazonaws.com").rstrip("/")
+        self.region = region
+        self._client = None
+
+    @property
+    def client(self):
+        # boto3 is only imported when S3 storage is used.
+        if self._client is None:
+            import boto3
+            self._client = boto3.session.Session().client(service_name="s3", region_name=self.region)
+        return self._client
+
+    async def save_stream(self, key: str, chunks, content_type: str, max_bytes: int) -> int:
+        key = self.prefix + key
+        buffer, size, parts, upload_id = bytearray(), 0, [], None
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ObjectTooLarge(f"Object is larger than {max_bytes} bytes")
+                buffer += chunk
+                if len(buffer) >= S3_PART_SIZE:
+                    if upload_id is None:
+                        upload = await run_in_threadpool(self.client.create_multipart_upload, Bucket=self.bucket, Key=key, ContentType=content_type)
+                        upload_id = upload["UploadId"]
+                    part = await run_in_threadpool(
+                        self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(buffer)
+                    )
+                    parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+                    buffer.clear()
+            if upload_id is None:
+                await run_in_threadpool(self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buffer), ContentType=content_type)
+                return size
+            if buffer:
+                part = await run_in_threadpool(
+                    self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=bytes(buffer)
+                )
+                parts.append({"ETag": part["ETag"], "PartNumber": len(parts) + 1})
+            await run_in_threadpool(
+                self.client.complete_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            if upload_id is not None:
+                await run_in_threadpool(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return size
+
+    def save(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=content_type,
+                               CacheControl="public, max-age=31536000, immutable")
+
+    def open(self, key: str):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{self.prefix}{key}"
+
+_store = None
+
+# Returns the configured object store, creating it on first use (also in image worker processes).
+def get_store() -> ObjectStore:
+    global _store
+    if _store is None:
+        _store = S3ObjectStore() if IMAGE_STORE == "s3" else LocalObjectStore()
+    return _store
+
+# Replaces the object store, e.g. with another backend.
+def set_store(store: ObjectStore):
+    global _store
+    _store = store
@@ -1,8 +1,8 @@
 import os
 import sys
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from db import SessionLocal, engine
+    from app.db import SessionLocal, engine
     from sqlalchemy import text  # <-- Add this line
     print("Attempting to connect to the database...")
     with engine.connect() as connection:
@@ -3,11 +3,10 @@
 import os
 import sys
 
-# Add the parent directory to the path to import db.py
-# This assumes db.py is in the same directory as this script.
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Add the parent directory to the path to import the app package.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from db import SessionLocal, engine, Base
+from app.db import SessionLocal, engine, Base
 from sqlalchemy import Column, Integer, String
 
 # --- Make sure this User model is identical to the one in your main.py and db.py ---
@@ -17,29 +16,32 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
 
-def get_all_users():
-    """Connects to the database and fetches all user records."""
+def get_all_users(batch_size=1000):
+    """Connects to the database and yields user records in batches.
+
+    Rows are streamed with yield_per, so memory use does not grow with the table.
+    For a full dump use: python -m app.export users --format csv
+    """
     db = SessionLocal()
     try:
-        # Use a list comprehension to fetch and store all users
-        users = db.query(User).all()
-        return users
+        yield from db.query(User).order_by(User.id).execution_options(stream_results=True).yield_per(batch_size)
     except Exception as e:
         print(f"An error occurred while querying the database: {e}")
-        return []
     finally:
         db.close()
 
 if __name__ == "__main__":
     print("Fetching users from the database...")
-    users = get_all_users()
-
-    if not users:
-        print("No users found or an error occurred.")
-    else:
-        print("\n--- Found Users ---")
-        for user in users:
-            print(f"ID: {user.id}")
-            print(f"Email: {user.email}")
-            print(f"Hashed Password: {user.hashed_password[:15]}...") # Truncate for display
-            print("-------------------")
\ No newline at end of file
+    found = 0
+
+    for user in get_all_users():
+        if not found:
+            print("\n--- Found Users ---")
+        found += 1
+        print(f"ID: {user.id}")
+        print(f"Email: {user.email}")
+        print(f"Hashed Password: {user.hashed_password[:15]}...") # Truncate for display
+        print("-------------------")
+
+    if not found:
+        print("No users found or an error occurred.")
\ No newline at end of file
@@ -0,0 +1,95 @@
+# Minimal in-process ASGI client shared by the benchmark scripts.
+# Requests go straight into the app without sockets, so timings measure the app itself.
+
+import json
+import time
+from urllib.parse import urlsplit
+
+# Sends one request to an ASGI app and returns (status, headers, body).
+# With chunk_size the body arrives in pieces of that size, as it would from a socket.
+async def request(app, method, path, json_body=None, headers=None, body=None, client=("127.0.0.1", 50000), chunk_size=None):
+    url = urlsplit(path)
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    if json_body is not None:
+        body = json.dumps(json_body).encode()
+        raw_headers.append((b"content-type", b"application/json"))
+    body = body or b""
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": "",
+        "headers": raw_headers,
+        "client": client,
+        "server": ("testserver", 80),
+    }
+    offset, done = 0, False
+    step = chunk_size or len(body) or 1
+    response = {"status": None, "headers": {}, "body": b""}
+
+    async def receive():
+        nonlocal offset, done
+        if not done:
+            chunk = body[offset:offset + step]
+            offset += step
+            done = offset >= len(body)
+            return {"type": "http.request", "body": chunk, "more_body": not done}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+# Sends a request and returns (status, elapsed seconds).
+async def timed_request(app, method, path, **kwargs):
+    start = time.perf_counter()
+    status, _, _ = await request(app, method, path, **kwargs)
+    return status, time.perf_counter() - start
+
+# Returns the p-th percentile of a list of samples.
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+# Summarises latency samples (seconds) as milliseconds.
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+# Runs the app's lifespan startup, returning a coroutine function that shuts it down.
+# This fires the same startup/shutdown handlers as uvicorn does.
+async def start_app(app):
+    import asyncio
+    receive_queue, send_queue = asyncio.Queue(), asyncio.Queue()
+    task = asyncio.ensure_future(app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive_queue.get, send_queue.put))
+    await receive_queue.put({"type": "lifespan.startup"})
+    message = await send_queue.get()
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"App startup failed: {message.get('message', message['type'])}")
+
+    async def stop():
+        await receive_queue.put({"type": "lifespan.shutdown"})
+        await send_queue.get()
+        await task
+
+    return stop
@@ -0,0 +1,88 @@
+# Measures logical backup and restore throughput (app/backup.py) in rows per second.
+#
+# Seeds a throwaway SQLite database with --users users and --products products, then for each
+# job count runs, through the command line as an operator would:
+#   dump    - the seeded database into a fresh backup directory
+#   restore - that backup into a fresh database (SQLite restores with one job)
+#   verify  - the restored database against the backup
+# Point SOURCE_DATABASE_URL / TARGET_DATABASE_URL at Postgres databases to measure COPY and
+# snapshot dumps instead; the target must be empty.
+#
+# Usage: python benchmarks/backup_restore.py [--products 200000] [--users 50000] [--jobs 1,2,4]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+def seed(database_url, users, products):
+    os.environ["DATABASE_URL"] = database_url
+    from app import models
+    from app.migrations import ensure_schema
+    from app.db import engine
+    ensure_schema(engine, mode="auto")
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [
+            {"email": f"user{i}@example.com", "hashed_password": "$2b$12$" + "x" * 53} for i in range(users)
+        ])
+        conn.execute(models.Product.__table__.insert(), [
+            {"name": f"Product {i}", "description": "Seeded for the backup benchmark " * 3, "price": f"{i % 5000}.{i % 100:02d}",
+             "image_url": None, "image_variants": {"thumb": f"/media/{i}-thumb.webp"} if i % 4 == 0 else None}
+            for i in range(products)
+        ])
+
+def run(command, directory, database_url, jobs, *extra):
+    env = dict(os.environ, DATABASE_URL=database_url, DB_SCHEMA_MODE="auto")
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "app.backup", command, directory, "--jobs", str(jobs), *extra],
+                         cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if out.returncode != 0 and command != "verify":
+        raise RuntimeError(f"{command} failed: {out.stderr.strip()}")
+    report = json.loads(out.stdout)
+    report["wall_seconds"] = round(elapsed, 2)
+    return report
+
+def main(args):
+    from app.cpu import available_cpus
+    workdir = tempfile.mkdtemp()
+    source = os.getenv("SOURCE_DATABASE_URL")
+    if source is None:
+        source = f"sqlite:///{workdir}/source.db"
+        seed(source, args.users, args.products)
+    results = []
+    for jobs in [int(n) for n in args.jobs.split(",")]:
+        backup_dir = os.path.join(workdir, f"backup-{jobs}")
+        target = os.getenv("TARGET_DATABASE_URL") or f"sqlite:///{workdir}/target-{jobs}.db"
+        dumped = run("dump", backup_dir, source, jobs, "--chunk-rows", str(args.chunk_rows))
+        restored = run("restore", backup_dir, target, jobs)
+        verified = run("verify", backup_dir, target, jobs)
+        size = sum(os.path.getsize(os.path.join(backup_dir, f)) for f in os.listdir(backup_dir))
+        results.append({
+            "jobs": jobs,
+            "chunks": dumped["chunks"],
+            "backup_mb": round(size / 1e6, 1),
+            "dump_rows_per_sec": dumped["rows_per_sec"],
+            "restore_rows_per_sec": restored["rows_per_sec"],
+            "verify_rows_per_sec": verified["rows_per_sec"],
+            "verified": verified["ok"],
+        })
+    print(json.dumps({
+        "rows": args.users + args.products if not os.getenv("SOURCE_DATABASE_URL") else dumped["rows"],
+        "available_cpus": available_cpus(),
+        "results": results,
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Logical backup and restore throughput")
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--jobs", default="1,2,4", help="comma separated job counts")
+    parser.add_argument("--chunk-rows", type=int, default=25000)
+    main(parser.parse_args())
@@ -0,0 +1,63 @@
+# Compares catalogue load throughput of the per-row crud path with the bulk chunk path.
+#
+# Uses a throwaway SQLite database unless DATABASE_URL is set.
+#
+# Usage: python benchmarks/bulk_load.py [--rows 20000] [--chunk 1000]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import crud, schemas
+from app.db import SessionLocal, engine, Base
+
+def make_products(rows):
+    return [schemas.ProductCreate(name=f"Product {i}", description="Seeded", price=Decimal("9.99")) for i in range(rows)]
+
+def per_row(products):
+    db = SessionLocal()
+    try:
+        for product in products:
+            crud.create_product(db, product)
+    finally:
+        db.close()
+
+def bulk(products, chunk_size):
+    db = SessionLocal()
+    try:
+        indexed = list(enumerate(products))
+        for start in range(0, len(indexed), chunk_size):
+            crud.create_products_chunk(db, indexed[start:start + chunk_size])
+        db.commit()
+    finally:
+        db.close()
+
+def rows_per_sec(func, rows):
+    start = time.perf_counter()
+    func()
+    return round(rows / (time.perf_counter() - start), 1)
+
+def main(rows, chunk_size):
+    Base.metadata.create_all(bind=engine)
+    products = make_products(rows)
+    results = {
+        "rows": rows,
+        "per_row_rows_per_sec": rows_per_sec(lambda: per_row(products), rows),
+        "bulk_rows_per_sec": rows_per_sec(lambda: bulk(products, chunk_size), rows),
+    }
+    results["speedup"] = round(results["bulk_rows_per_sec"] / results["per_row_rows_per_sec"], 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-row vs bulk product load throughput")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=crud.BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+    main(args.rows, args.chunk)
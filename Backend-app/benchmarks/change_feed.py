@@ -0,0 +1,106 @@
+# Measures product change feed fan-out: how long a write takes to reach every subscriber.
+#
+# Starts the API (uvicorn, one process) on a free port against a throwaway SQLite database,
+# opens --subscribers streams on GET /api/products/changes, then makes --writes product
+# updates one after another. Reports the delay from sending each write to its event
+# arriving on every stream, and the events delivered. However many subscribers there are,
+# the process reads each change from the database once.
+#
+# Usage: python benchmarks/change_feed.py [--subscribers 500] [--writes 200]
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+from worker_scaling import free_port, wait_ready  # noqa: E402
+
+LOGIN = {"email": "feed@example.com", "password": "feed-password"}
+
+def call(port, method, path, body=None, headers=None):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method=method, data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+# One stream; records when each version arrives until `expected` versions have.
+async def subscribe(port, arrivals, expected, ready):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /api/products/changes HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    seen = {}
+    buffer = b""
+    try:
+        while len(seen) < expected:
+            buffer += await reader.read(65536)
+            while b"\n\n" in buffer:
+                block, buffer = buffer.split(b"\n\n", 1)
+                fields = dict(line.split(": ", 1) for line in block.decode().splitlines() if ": " in line)
+                if fields.get("event") == "ready":
+                    ready.release()
+                elif fields.get("event") == "updated":
+                    seen.setdefault(int(fields["id"]), time.perf_counter())
+    finally:
+        writer.close()
+    arrivals.append(seen)
+
+# Versions start after base_version, the product's creation.
+async def run(args, port, auth, product_id, base_version):
+    arrivals = []
+    ready = asyncio.Semaphore(0)
+    streams = [asyncio.create_task(subscribe(port, arrivals, args.writes, ready)) for _ in range(args.subscribers)]
+    for _ in streams:
+        await ready.acquire()
+    written = {}
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    for i in range(args.writes):
+        body = {"name": f"Feed {i}", "description": "d", "price": "1.00"}
+        written[base_version + i + 1] = time.perf_counter()
+        await loop.run_in_executor(None, call, port, "PUT", f"/api/products/{product_id}", body, auth)
+    await asyncio.wait_for(asyncio.gather(*streams), timeout=120)
+    elapsed = time.perf_counter() - start
+    delays = [seen[version] - written[version] for seen in arrivals for version in seen if version in written]
+    return elapsed, delays
+
+def main(args):
+    from asgi_client import summarize
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/feed.db", LOGIN_IP_PER_MINUTE="0",
+               LOGIN_EMAIL_PER_MINUTE="0", FEED_HEARTBEAT="60", METRICS_SAMPLE_RATE="0")
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--no-access-log"],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        call(port, "POST", "/api/auth/register", LOGIN)
+        auth = {"Authorization": f"Bearer {call(port, 'POST', '/api/auth/login', LOGIN)['access_token']}"}
+        product_id = call(port, "POST", "/api/products/", {"name": "Feed", "description": "d", "price": "1.00"}, auth)["id"]
+        elapsed, delays = asyncio.run(run(args, port, auth, product_id, base_version=1))
+        hub = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/health/feed").read())
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    print(json.dumps({
+        "subscribers": args.subscribers,
+        "writes": args.writes,
+        "events_delivered": len(delays),
+        "events_per_sec": round(len(delays) / elapsed),
+        "write_to_event": summarize(delays),
+        "hub": hub,
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product change feed fan-out latency")
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=200)
+    main(parser.parse_args())
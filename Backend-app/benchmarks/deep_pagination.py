@@ -0,0 +1,66 @@
+# Compares offset and keyset (cursor) pagination latency at increasing page depths.
+#
+# Seeds a throwaway SQLite catalogue unless DATABASE_URL points somewhere else.
+#
+# Usage: python benchmarks/deep_pagination.py [--rows 200000] [--limit 100] [--repeat 20]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from app import crud, models
+from app.db import SessionLocal, engine, Base
+from asgi_client import summarize
+
+def seed(rows):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        existing = conn.execute(models.Product.__table__.select().limit(1)).first()
+        if existing:
+            return
+        batch = []
+        for i in range(rows):
+            batch.append({"name": f"Product {i}", "description": "Seeded", "price": "9.99", "image_url": None})
+            if len(batch) == 10000:
+                conn.execute(models.Product.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(models.Product.__table__.insert(), batch)
+
+def time_calls(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+def main(rows, limit, repeat):
+    seed(rows)
+    last_page = rows // limit - 1
+    depths = sorted({0, 10, 100, last_page // 2, last_page})
+    results = []
+    db = SessionLocal()
+    try:
+        for page in depths:
+            offset = time_calls(lambda: crud.get_products(db, skip=page * limit, limit=limit), repeat)
+            cursor = crud.encode_cursor(page * limit) if page else ""
+            keyset = time_calls(lambda: crud.get_products_after(db, after=cursor, limit=limit), repeat)
+            results.append({"page": page, "offset": offset, "keyset": keyset})
+    finally:
+        db.close()
+    print(json.dumps({"rows": rows, "limit": limit, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offset vs keyset pagination latency by page depth")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.limit, args.repeat)
@@ -0,0 +1,70 @@
+# Checks that streaming exports keep memory flat on a large table.
+#
+# Seeds a million-row SQLite stand-in in a child process, then exports it as NDJSON and
+# CSV and fails if peak RSS grew by more than --max-growth-mb over the pre-export baseline.
+#
+# Usage: python benchmarks/export_memory.py [--rows 1000000] [--max-growth-mb 50]
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def seed(rows):
+    from app import models
+    from app.db import engine, Base
+    Base.metadata.create_all(bind=engine)
+    table = models.Product.__table__
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            batch = [
+                {"name": f"Product {i}", "description": "Seeded for the export check", "price": "9.99", "image_url": None}
+                for i in range(start, min(rows, start + 10000))
+            ]
+            conn.execute(table.insert(), batch)
+
+def main(args):
+    if args.seed_only:
+        seed(args.rows)
+        return
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/export.db")
+    subprocess.run([sys.executable, __file__, "--seed-only", "--rows", str(args.rows)], check=True, env=os.environ, stdout=subprocess.DEVNULL)
+
+    from app import export
+    from app.db import engine
+    results = {"rows": args.rows, "baseline_rss_mb": round(peak_rss_mb(), 1)}
+    for fmt in ("ndjson", "csv"):
+        start = time.perf_counter()
+        written = 0
+        with open(os.devnull, "wb") as out:
+            for chunk in export.iter_export(engine, "products", fmt):
+                written += len(chunk)
+                out.write(chunk)
+        results[fmt] = {
+            "mb_written": round(written / 1024 / 1024, 1),
+            "rows_per_sec": round(args.rows / (time.perf_counter() - start)),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    growth = peak_rss_mb() - results["baseline_rss_mb"]
+    results["rss_growth_mb"] = round(growth, 1)
+    print(json.dumps(results, indent=2))
+    if growth > args.max_growth_mb:
+        sys.exit(f"Peak RSS grew by {growth:.1f} MB during export (limit {args.max_growth_mb} MB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of streaming exports")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--max-growth-mb", type=float, default=50.0)
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -0,0 +1,152 @@
+# Failover drill: kills and restarts the database path under load and reports how the API behaves.
+#
+# Puts a TCP proxy in front of a Postgres server, points the app at the proxy, and runs
+# product readers through three phases:
+#   healthy  - proxy up
+#   outage   - proxy stops listening and drops every open connection (a dead primary)
+#   recovery - proxy comes back (the promoted primary); runs until reads succeed again
+# Expect 503s within a few requests of the outage, no request waiting for the full connect
+# timeout once the breaker is open, and recovery within about DB_BREAKER_PROBE_INTERVAL.
+#
+# Usage: python benchmarks/failover_drill.py --database-url postgresql+psycopg2://user:pw@localhost:5432/app
+#        [--readers 8] [--outage 10]
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stand-in for the database endpoint that can be killed and restarted.
+class TcpProxy:
+    def __init__(self, target_host, target_port):
+        self.target = (target_host, target_port)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.writers = set()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.target)
+        except OSError:
+            client_writer.close()
+            return
+        self.writers.update((client_writer, upstream_writer))
+        await asyncio.gather(self._pipe(client_reader, upstream_writer), self._pipe(upstream_reader, client_writer))
+        self.writers.difference_update((client_writer, upstream_writer))
+
+    async def _start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", self.port, reuse_address=True)
+
+    async def _stop(self):
+        self.server.close()
+        for writer in list(self.writers):
+            writer.transport.abort()
+        self.writers.clear()
+
+    def start(self):
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+
+async def read_loop(app, request, stop, phase, results):
+    product_id = 0
+    while not stop.is_set():
+        product_id = product_id % 100 + 1
+        start = time.perf_counter()
+        status, _, _ = await request(app, "GET", f"/api/products/{product_id}")
+        entry = results[phase[0]]
+        entry["latencies"].append(time.perf_counter() - start)
+        entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+        if status == 503 and entry["first_503_at"] is None:
+            entry["first_503_at"] = time.perf_counter()
+        if status == 200 and phase[0] == "recovery" and entry["recovered_at"] is None:
+            entry["recovered_at"] = time.perf_counter()
+        await asyncio.sleep(0.02)
+
+async def drill(args, proxy):
+    from app.main import app
+    from app import models
+    from app.db import engine, Base
+    from asgi_client import request, start_app, summarize
+
+    stop_app = await start_app(app)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if conn.execute(models.Product.__table__.select().limit(1)).first() is None:
+            conn.execute(models.Product.__table__.insert(), [
+                {"name": f"Drill {i}", "description": "Failover drill", "price": "1.00", "image_url": None} for i in range(100)
+            ])
+
+    results = {name: {"latencies": [], "statuses": {}, "first_503_at": None, "recovered_at": None} for name in ("healthy", "outage", "recovery")}
+    phase = ["healthy"]
+    stop = asyncio.Event()
+    readers = [asyncio.ensure_future(read_loop(app, request, stop, phase, results)) for _ in range(args.readers)]
+    try:
+        await asyncio.sleep(args.healthy)
+        phase[0] = "outage"
+        outage_started = time.perf_counter()
+        proxy.stop()
+        await asyncio.sleep(args.outage)
+        phase[0] = "recovery"
+        restarted = time.perf_counter()
+        proxy.start()
+        while results["recovery"]["recovered_at"] is None and time.perf_counter() - restarted < args.max_recovery:
+            await asyncio.sleep(0.1)
+    finally:
+        stop.set()
+        await asyncio.gather(*readers)
+        await stop_app()
+
+    report = {}
+    for name, entry in results.items():
+        report[name] = {"latency": summarize(entry["latencies"]), "statuses": {str(k): v for k, v in sorted(entry["statuses"].items())}}
+    first_503 = results["outage"]["first_503_at"]
+    recovered = results["recovery"]["recovered_at"]
+    report["seconds_to_first_503"] = round(first_503 - outage_started, 2) if first_503 else None
+    report["seconds_to_recover_after_restart"] = round(recovered - restarted, 2) if recovered else None
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Database failover drill through a killable TCP proxy")
+    parser.add_argument("--database-url", required=True, help="Postgres URL of the real server")
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--healthy", type=float, default=5, help="seconds before the outage")
+    parser.add_argument("--outage", type=float, default=10, help="seconds the proxy stays down")
+    parser.add_argument("--max-recovery", type=float, default=60)
+    args = parser.parse_args()
+
+    url = urlsplit(args.database_url)
+    proxy = TcpProxy(url.hostname, url.port or 5432)
+    proxy.start()
+    netloc = url.netloc.rsplit("@", 1)[0] + "@" if "@" in url.netloc else ""
+    os.environ["DATABASE_URL"] = urlunsplit(url._replace(netloc=f"{netloc}127.0.0.1:{proxy.port}"))
+    os.environ.setdefault("SECRET_KEY", "drill-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("PRODUCT_CACHE_TTL", "0")  # Every read must reach the database
+    os.environ.setdefault("DB_SCHEMA_MODE", "off")
+    print(json.dumps(asyncio.run(drill(args, proxy)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Measures concurrent product image upload throughput and the memory each upload holds.
+#
+# Uploads a generated JPEG to PUT /api/products/{id}/image from --concurrency clients, with the
+# body arriving in --chunk-kb pieces, against a throwaway SQLite database and local store.
+# Reports:
+#   accept  - time until the 202 (the body has streamed into the store)
+#   done    - time until the variants are stored and written back onto the product
+#   peak_traced_mb - peak Python allocations in the API process while uploading, next to
+#                    what buffering every body in flight would need
+#
+# Usage: python benchmarks/image_upload.py [--uploads 64] [--concurrency 16] [--width 3000] [--height 2000]
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/images.db")
+os.environ.setdefault("IMAGE_STORE_PATH", tempfile.mkdtemp())
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ADMISSION_UPLOAD_QUEUE", "1000")
+os.environ.setdefault("IMAGE_QUEUE_SIZE", "1000")
+
+def make_jpeg(width, height):
+    from PIL import Image
+    image = Image.merge("RGB", [Image.effect_noise((width, height), sigma) for sigma in (40, 60, 80)])
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+async def run(args):
+    from app.main import app
+    from asgi_client import request, start_app, summarize
+
+    # Records when each response starts; background tasks run before request() returns.
+    accepted = {}
+    async def timed_app(scope, receive, send):
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                accepted[scope["path"]] = time.perf_counter()
+            await send(message)
+        await app(scope, receive, timed_send)
+
+    stop_app = await start_app(app)
+    try:
+        user = {"email": "images@example.com", "password": "benchmark-password"}
+        await request(app, "POST", "/api/auth/register", json_body=user)
+        _, _, body = await request(app, "POST", "/api/auth/login", json_body=user)
+        auth = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+        ids = []
+        for i in range(args.uploads):
+            _, _, body = await request(app, "POST", "/api/products/", json_body={"name": f"Image {i}", "description": "d", "price": "1.00"}, headers=auth)
+            ids.append(json.loads(body)["id"])
+        image = make_jpeg(args.width, args.height)
+        headers = dict(auth, **{"content-type": "image/jpeg"})
+
+        accept_latencies, done_latencies, statuses = [], [], {}
+        semaphore = asyncio.Semaphore(args.concurrency)
+        async def upload(product_id):
+            path = f"/api/products/{product_id}/image"
+            async with semaphore:
+                start = time.perf_counter()
+                status, _, _ = await request(timed_app, "PUT", path, body=image, headers=headers, chunk_size=args.chunk_kb * 1024)
+                done_latencies.append(time.perf_counter() - start)
+                accept_latencies.append(accepted[path] - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        await asyncio.gather(*[upload(product_id) for product_id in ids])
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        _, _, body = await request(app, "GET", f"/api/products/{ids[-1]}")
+        variants = json.loads(body)["image_variants"] or {}
+    finally:
+        await stop_app()
+    return {
+        "uploads": args.uploads,
+        "concurrency": args.concurrency,
+        "image_mb": round(len(image) / 1e6, 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "uploads_per_sec": round(args.uploads / elapsed, 1),
+        "ingest_mb_per_sec": round(args.uploads * len(image) / 1e6 / elapsed, 1),
+        "accept": summarize(accept_latencies),
+        "done": summarize(done_latencies),
+        "variants": sorted(variants),
+        "peak_traced_mb": round(peak / 1e6, 1),
+        "buffered_bodies_mb": round(args.concurrency * len(image) / 1e6, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent product image upload throughput")
+    parser.add_argument("--uploads", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
@@ -0,0 +1,229 @@
+# Reproducible load test for the whole API.
+#
+# Boots app.main (including its startup handlers) in-process against a throwaway SQLite
+# database unless DATABASE_URL is set, seeds users and products, then drives a weighted mix
+# of signup, login, authenticated CRUD, deep pagination and concurrent reads from
+# --concurrency virtual users. Operation order is fixed by --seed, and the workload is
+# repeated --runs times with the median of each figure reported.
+#
+# Reports throughput and p50/p95/p99 latency per route as JSON (--output to save it) and,
+# with --baseline, fails if any route's p95 or throughput regressed beyond --tolerance.
+#
+# Usage:
+#   python benchmarks/load_test.py --output results.json
+#   python benchmarks/load_test.py --baseline benchmarks/baseline.json
+#   python benchmarks/load_test.py --save-baseline benchmarks/baseline.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/load.db")
+os.environ.setdefault("SECRET_KEY", "load-test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from asgi_client import request, start_app, summarize
+
+PASSWORD = "load-test-password"
+
+# Relative weights of each operation per workload mix.
+MIXES = {
+    "mixed": {
+        "list": 30, "get": 25, "keyset_deep": 10, "offset_deep": 5,
+        "create": 8, "update": 8, "delete": 4, "login": 6, "signup": 4,
+    },
+    "reads": {"list": 45, "get": 35, "keyset_deep": 15, "offset_deep": 5},
+    "writes": {"create": 40, "update": 40, "delete": 20},
+    "auth": {"login": 60, "signup": 40},
+}
+
+def seed(users, products):
+    from app import models
+    from app.auth import auth
+    from app.db import engine
+    # One shared hash keeps seeding fast; every seeded user logs in with PASSWORD.
+    hashed = auth.hash_password(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": f"seed{i}@example.com", "hashed_password": hashed} for i in range(users)])
+        for start in range(0, products, 10000):
+            conn.execute(models.Product.__table__.insert(), [
+                {"name": f"Product {i}", "description": "Seeded for the load test", "price": "19.99", "image_url": None}
+                for i in range(start, min(products, start + 10000))
+            ])
+
+class Workload:
+    def __init__(self, app, users, products, token):
+        from app import crud
+        self.app = app
+        self.users = users
+        self.products = products
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.encode_cursor = crud.encode_cursor
+        self.created = []
+        self.signups = 0
+
+    def product_body(self, rng):
+        return {"name": f"Load {rng.randrange(10**6)}", "description": "Written by the load test", "price": f"{rng.randrange(100, 10000) / 100:.2f}"}
+
+    # Each operation returns (route label, status).
+    async def list(self, rng):
+        status, _, _ = await request(self.app, "GET", f"/api/products/?skip={rng.randrange(0, 10) * 100}&limit=100")
+        return "GET /api/products/", status
+
+    async def get(self, rng):
+        status, _, _ = await request(self.app, "GET", f"/api/products/{rng.randrange(1, self.products + 1)}")
+        return "GET /api/products/{id}", status
+
+    async def keyset_deep(self, rng):
+        cursor = self.encode_cursor(rng.randrange(self.products // 2, self.products - 100))
+        status, _, _ = await request(self.app, "GET", f"/api/products/?after={cursor}&limit=100")
+        return "GET /api/products/?after (deep)", status
+
+    async def offset_deep(self, rng):
+        status, _, _ = await request(self.app, "GET", f"/api/products/?skip={rng.randrange(self.products // 2, self.products - 100)}&limit=100")
+        return "GET /api/products/?skip (deep)", status
+
+    async def create(self, rng):
+        status, _, body = await request(self.app, "POST", "/api/products/", json_body=self.product_body(rng), headers=self.auth)
+        if status == 201:
+            self.created.append(json.loads(body)["id"])
+        return "POST /api/products/", status
+
+    async def update(self, rng):
+        product_id = rng.randrange(1, self.products + 1)
+        status, _, _ = await request(self.app, "PUT", f"/api/products/{product_id}", json_body=self.product_body(rng), headers=self.auth)
+        return "PUT /api/products/{id}", status
+
+    async def delete(self, rng):
+        if not self.created:
+            return await self.create(rng)
+        status, _, _ = await request(self.app, "DELETE", f"/api/products/{self.created.pop()}", headers=self.auth)
+        return "DELETE /api/products/{id}", status
+
+    async def login(self, rng):
+        body = {"email": f"seed{rng.randrange(self.users)}@example.com", "password": PASSWORD}
+        status, _, _ = await request(self.app, "POST", "/api/auth/login", json_body=body)
+        return "POST /api/auth/login", status
+
+    async def signup(self, rng):
+        self.signups += 1
+        body = {"email": f"new{self.signups}-{rng.randrange(10**9)}@example.com", "password": PASSWORD}
+        status, _, _ = await request(self.app, "POST", "/api/auth/register", json_body=body)
+        return "POST /api/auth/register", status
+
+async def virtual_user(workload, operations, samples, errors):
+    for name, rng in operations:
+        start = time.perf_counter()
+        route, status = await getattr(workload, name)(rng)
+        samples.setdefault(route, []).append(time.perf_counter() - start)
+        # 503 is load shedding (e.g. a full hashing queue); it depends on timing, so it is
+        # reported separately and not compared against the baseline.
+        if status >= 400:
+            kind = "shed" if status == 503 else "errors"
+            counts = errors.setdefault(route, {"errors": 0, "shed": 0})
+            counts[kind] += 1
+
+async def run(args):
+    from app.main import app
+    from app import cache
+
+    stop = await start_app(app)
+    try:
+        seed(args.users, args.products)
+        cache.product_cache.invalidate()
+        _, _, body = await request(app, "POST", "/api/auth/login", json_body={"email": "seed0@example.com", "password": PASSWORD})
+        workload = Workload(app, args.users, args.products, json.loads(body)["access_token"])
+
+        # Plan every operation up front so runs with the same seed issue the same requests.
+        mix = MIXES[args.mix]
+        rng = random.Random(args.seed)
+        plans = [[] for _ in range(args.concurrency)]
+        for i in range(args.requests):
+            name = rng.choices(list(mix), weights=list(mix.values()))[0]
+            plans[i % args.concurrency].append((name, random.Random(rng.random())))
+
+        runs = []
+        for _ in range(args.runs):
+            samples, errors = {}, {}
+            start = time.perf_counter()
+            await asyncio.gather(*(virtual_user(workload, plan, samples, errors) for plan in plans))
+            runs.append((samples, errors, time.perf_counter() - start))
+    finally:
+        await stop()
+
+    # Each figure is the median across runs, which keeps one noisy run from failing the check.
+    routes = {}
+    for route in sorted(runs[0][0]):
+        per_run = []
+        for samples, errors, elapsed in runs:
+            stats = summarize(samples[route])
+            stats["rps"] = round(len(samples[route]) / elapsed, 1)
+            stats.update(errors.get(route, {"errors": 0, "shed": 0}))
+            per_run.append(stats)
+        routes[route] = {key: statistics.median(stats[key] for stats in per_run) for key in per_run[0]}
+    elapsed = statistics.median(elapsed for _, _, elapsed in runs)
+    return {
+        "config": {key: getattr(args, key) for key in ("mix", "requests", "concurrency", "users", "products", "seed", "runs")},
+        "machine": {"python": platform.python_version(), "cpus": os.cpu_count(), "dialect": os.environ["DATABASE_URL"].split(":")[0]},
+        "total": {"requests": args.requests, "seconds": round(elapsed, 2), "rps": round(args.requests / elapsed, 1)},
+        "routes": routes,
+    }
+
+# Returns a list of regressions of results against a baseline.
+# Tiny absolute differences are ignored so sub-millisecond routes do not flap.
+def compare(results, baseline, tolerance, min_delta_ms=2.0):
+    regressions = []
+    if results["config"] != baseline["config"]:
+        regressions.append(f"config differs from baseline: {baseline['config']}")
+    for route, base in baseline["routes"].items():
+        current = results["routes"].get(route)
+        if current is None:
+            regressions.append(f"{route}: missing from this run")
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) and current["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{route}: p95 {current['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: {current['rps']} req/s vs baseline {base['rps']} req/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{route}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed-workload load test with baseline comparison")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=3, help="repeat the workload and report medians")
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="compare against this results JSON and exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write results JSON as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown (default 0.25)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit("Regressions against baseline:\n  " + "\n  ".join(regressions))
+        print("No regressions against baseline.", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Measures product read tail latency during a login flood, with and without admission control.
+#
+# Each mode runs in its own process against a throwaway SQLite database:
+#   off - no auth concurrency limit, no login rate limits, unbounded hashing queue
+#   on  - the defaults from app/admission.py and app/auth/auth.py
+# Flood clients log in from --client-ips addresses; readers fetch products meanwhile.
+# The product cache is disabled so every read reaches the database.
+#
+# Usage: python benchmarks/login_shedding.py [--flood 64] [--readers 4] [--duration 10]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = {
+    "off": {"ADMISSION_AUTH_CONCURRENCY": "0", "LOGIN_IP_PER_MINUTE": "0", "LOGIN_EMAIL_PER_MINUTE": "0", "HASH_QUEUE_SIZE": "1000000"},
+    "on": {},
+}
+
+PASSWORD = "flood-password"
+
+def seed(users):
+    from app import models
+    from app.auth import auth
+    from app.db import engine
+    hashed = auth.hash_password(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), [{"email": f"user{i}@example.com", "hashed_password": hashed} for i in range(users)])
+        conn.execute(models.Product.__table__.insert(), [
+            {"name": f"Product {i}", "description": "Seeded", "price": "9.99", "image_url": None} for i in range(1000)
+        ])
+
+async def read_loop(app, request, stop, samples):
+    rng = random.Random()
+    while not stop.is_set():
+        start = time.perf_counter()
+        await request(app, "GET", f"/api/products/{rng.randrange(1, 1001)}")
+        samples.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+async def login_loop(app, request, stop, args, outcomes):
+    rng = random.Random()
+    while not stop.is_set():
+        body = {"email": f"user{rng.randrange(args.users)}@example.com", "password": PASSWORD}
+        client = (f"10.0.{rng.randrange(args.client_ips) // 256}.{rng.randrange(args.client_ips) % 256}", 40000)
+        status, _, _ = await request(app, "POST", "/api/auth/login", json_body=body, client=client)
+        outcomes[status] = outcomes.get(status, 0) + 1
+        if status in (429, 503):
+            # An aggressive client that retries well before Retry-After.
+            await asyncio.sleep(0.1)
+
+async def run_child(args):
+    from app.main import app
+    from asgi_client import request, start_app, summarize
+
+    stop_app = await start_app(app)
+    try:
+        seed(args.users)
+        baseline = []
+        stop = asyncio.Event()
+        readers = [asyncio.ensure_future(read_loop(app, request, stop, baseline)) for _ in range(args.readers)]
+        await asyncio.sleep(2)
+        stop.set()
+        await asyncio.gather(*readers)
+
+        samples, outcomes = [], {}
+        stop = asyncio.Event()
+        tasks = [asyncio.ensure_future(read_loop(app, request, stop, samples)) for _ in range(args.readers)]
+        tasks += [asyncio.ensure_future(login_loop(app, request, stop, args, outcomes)) for _ in range(args.flood)]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+    finally:
+        await stop_app()
+    return {
+        "reads_idle": summarize(baseline),
+        "reads_during_flood": summarize(samples),
+        "logins_per_sec": round(outcomes.get(200, 0) / args.duration, 1),
+        "login_statuses": {str(k): v for k, v in sorted(outcomes.items())},
+    }
+
+def main(args):
+    if args.child:
+        print(json.dumps(asyncio.run(run_child(args))))
+        return
+    results = {"flood": args.flood, "readers": args.readers, "duration_sec": args.duration}
+    for mode, overrides in MODES.items():
+        env = dict(os.environ, **overrides)
+        env.update(DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/shed.db", PRODUCT_CACHE_TTL="0", METRICS_SAMPLE_RATE="0")
+        env.setdefault("SECRET_KEY", "benchmark-secret")
+        env.setdefault("ALGORITHM", "HS256")
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", "--flood", str(args.flood), "--readers", str(args.readers),
+             "--duration", str(args.duration), "--users", str(args.users), "--client-ips", str(args.client_ips)],
+            env=env, check=True, capture_output=True, text=True,
+        )
+        results[mode] = json.loads(child.stdout.strip().splitlines()[-1])
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read latency under a login flood, with and without shedding")
+    parser.add_argument("--flood", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent product readers")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--client-ips", type=int, default=1000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+# Measures product GET latency while a burst of logins runs against the same app.
+#
+# Compares bcrypt verification inline in a sync handler (holding a threadpool slot)
+# with verification on the hashing executor from app/auth/auth.py.
+#
+# Usage: python benchmarks/login_storm.py [--logins 64] [--duration 5]
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, HTTPException
+from app.auth import auth
+from asgi_client import timed_request, summarize
+
+PRODUCTS = [{"id": i, "name": f"Product {i}", "price": "9.99"} for i in range(20)]
+
+def build_app(stored_hash):
+    app = FastAPI()
+
+    # Stand-in for read_products: a short blocking DB call on the threadpool.
+    @app.get("/api/products/")
+    def read_products():
+        time.sleep(0.002)
+        return PRODUCTS
+
+    @app.post("/login/inline")
+    def login_inline():
+        return {"ok": auth.verify_password("password123", stored_hash)}
+
+    @app.post("/login/pooled")
+    async def login_pooled():
+        try:
+            return {"ok": await auth.verify_password_async("password123", stored_hash)}
+        except auth.HashingQueueFull:
+            raise HTTPException(status_code=503, headers={"Retry-After": "1"})
+
+    return app
+
+async def read_loop(app, stop, samples):
+    while not stop.is_set():
+        _, elapsed = await timed_request(app, "GET", "/api/products/")
+        samples.append(elapsed)
+        await asyncio.sleep(0.01)
+
+async def login_loop(app, path, stop, counter):
+    while not stop.is_set():
+        status, _ = await timed_request(app, "POST", path)
+        if status == 200:
+            counter[0] += 1
+        else:
+            # Rejected by the bounded hashing queue; back off like a real client.
+            counter[1] += 1
+            await asyncio.sleep(0.05)
+
+async def run_case(app, login_path, logins, duration):
+    stop = asyncio.Event()
+    samples, counter = [], [0, 0]
+    tasks = [asyncio.create_task(read_loop(app, stop, samples))]
+    if login_path:
+        tasks += [asyncio.create_task(login_loop(app, login_path, stop, counter)) for _ in range(logins)]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    result = summarize(samples)
+    result["logins_per_sec"] = round(counter[0] / duration, 1)
+    result["logins_rejected"] = counter[1]
+    return result
+
+async def main(logins, duration):
+    stored_hash = auth.hash_password("password123")
+    app = build_app(stored_hash)
+    # Warm the process pool so worker start-up is not counted.
+    await auth.verify_password_async("password123", stored_hash)
+    results = {
+        "idle": await run_case(app, None, logins, duration),
+        "storm_inline": await run_case(app, "/login/inline", logins, duration),
+        "storm_pooled": await run_case(app, "/login/pooled", logins, duration),
+    }
+    auth.shutdown_hash_executor()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product GET latency during a login storm")
+    parser.add_argument("--logins", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per case")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.duration))
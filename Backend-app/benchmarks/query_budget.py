@@ -0,0 +1,78 @@
+# Checks that each write endpoint stays within its budget of SQL statements.
+#
+# Runs the endpoints in-process against a throwaway SQLite database (or DATABASE_URL) and
+# counts the statements each request sends. Signup, product create, update and delete are
+# single statements (INSERT ... ON CONFLICT DO NOTHING / INSERT, UPDATE, DELETE ... RETURNING),
+# including the duplicate-email and missing-product cases. Exits non-zero if any request
+# goes over budget or returns an unexpected status, so it can run in CI.
+#
+# Usage: python benchmarks/query_budget.py
+#        ASYNC_DB=true DATABASE_URL=sqlite+aiosqlite:///... python benchmarks/query_budget.py
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/budget.db")
+os.environ.setdefault("SECRET_KEY", "budget-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("READY_CHECK_INTERVAL", "3600")  # Keep the readiness probe out of the counts
+
+PRODUCT = {"name": "Budget", "description": "Query budget check", "price": "9.99"}
+USER = {"email": "budget@example.com", "password": "budget-password"}
+
+# (name, method, path, body, expected status, max statements).
+# The first authenticated request also loads the user behind the token; later ones hit the token cache.
+STEPS = [
+    ("register", "POST", "/api/auth/register", USER, 200, 1),
+    ("register duplicate", "POST", "/api/auth/register", USER, 400, 1),
+    ("signup", "POST", "/api/v1/users/signup", {"email": "signup@example.com", "password": "pw"}, 201, 1),
+    ("signup duplicate", "POST", "/api/v1/users/signup", {"email": "signup@example.com", "password": "pw"}, 400, 1),
+    ("login", "POST", "/api/auth/login", USER, 200, 1),
+    ("create product (first authenticated request)", "POST", "/api/products/", PRODUCT, 201, 2),
+    ("create product", "POST", "/api/products/", PRODUCT, 201, 1),
+    ("update product", "PUT", "/api/products/1", dict(PRODUCT, name="Updated"), 200, 1),
+    ("update missing product", "PUT", "/api/products/999999", PRODUCT, 404, 1),
+    ("delete product", "DELETE", "/api/products/1", None, 204, 1),
+    ("delete missing product", "DELETE", "/api/products/1", None, 404, 1),
+]
+
+async def run():
+    from sqlalchemy import event
+    from app.main import app
+    from app.db import engine, async_engine, Base
+    from asgi_client import request, start_app
+
+    counted = {"statements": 0}
+    def count(conn, cursor, statement, parameters, context, executemany):
+        counted["statements"] += 1
+    for db_engine in (engine, async_engine.sync_engine if async_engine is not None else None):
+        if db_engine is not None:
+            event.listen(db_engine, "before_cursor_execute", count)
+
+    stop_app = await start_app(app)
+    Base.metadata.create_all(bind=engine)
+    headers, report, failures = {}, [], 0
+    try:
+        for name, method, path, body, expected_status, budget in STEPS:
+            counted["statements"] = 0
+            status, _, response_body = await request(app, method, path, json_body=body, headers=headers)
+            statements = counted["statements"]
+            ok = status == expected_status and statements <= budget
+            failures += not ok
+            report.append({"request": name, "status": status, "statements": statements, "budget": budget, "ok": ok})
+            if name == "login" and status == 200:
+                headers = {"Authorization": f"Bearer {json.loads(response_body)['access_token']}"}
+    finally:
+        await stop_app()
+    print(json.dumps(report, indent=2))
+    return failures
+
+if __name__ == "__main__":
+    failures = asyncio.run(run())
+    if failures:
+        print(f"{failures} request(s) over their query budget or with an unexpected status")
+        sys.exit(1)
@@ -0,0 +1,83 @@
+# Measures product search latency over a large catalogue.
+#
+# Seeds --rows products (default 1M) from a small vocabulary into a throwaway SQLite
+# database, or into DATABASE_URL if set, builds the search indexes, then times
+# first pages and deep keyset pages for common, rare and multi-word queries.
+#
+# Usage: python benchmarks/search_latency.py [--rows 1000000] [--repeat 20]
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/search.db")
+
+from app import models, search
+from app.db import SessionLocal, engine, Base
+from asgi_client import summarize
+
+COLOURS = ["red", "blue", "green", "black", "white", "silver", "amber", "teal"]
+ITEMS = ["shoe", "jacket", "lamp", "kettle", "backpack", "watch", "scarf", "blender"]
+ADJECTIVES = ["waterproof", "vintage", "compact", "wireless", "organic", "premium", "folding", "ceramic"]
+
+QUERIES = {
+    "common_term": "red",
+    "two_terms": "wireless lamp",
+    "rare_term": "zephyr",
+    "typo": "backpak",
+}
+
+def seed(rows):
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(42)
+    table = models.Product.__table__
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            batch = []
+            for i in range(start, min(rows, start + 10000)):
+                name = f"{rng.choice(COLOURS)} {rng.choice(ADJECTIVES)} {rng.choice(ITEMS)}"
+                description = " ".join(rng.choice(ADJECTIVES + ITEMS) for _ in range(8))
+                if i % 100000 == 0:
+                    description += " zephyr"
+                batch.append({"name": name, "description": description, "price": "19.99", "image_url": None})
+            conn.execute(table.insert(), batch)
+        search.create_search_indexes(conn)
+
+def time_query(q, repeat, pages):
+    first, deep = [], []
+    db = SessionLocal()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _, cursor = search.search_products(db, q, limit=20)
+            first.append(time.perf_counter() - start)
+            for _ in range(pages):
+                if not cursor:
+                    break
+                start = time.perf_counter()
+                _, cursor = search.search_products(db, q, after=cursor, limit=20)
+                deep.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return {"first_page": summarize(first), "next_pages": summarize(deep)}
+
+def main(rows, repeat, pages):
+    start = time.perf_counter()
+    seed(rows)
+    results = {"rows": rows, "dialect": engine.dialect.name, "seed_and_index_sec": round(time.perf_counter() - start, 1)}
+    for name, q in QUERIES.items():
+        results[name] = time_query(q, repeat, pages)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Product search latency over a large catalogue")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5, help="keyset pages to follow per query")
+    args = parser.parse_args()
+    main(args.rows, args.repeat, args.pages)
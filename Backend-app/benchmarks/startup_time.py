@@ -0,0 +1,67 @@
+# Measures the time from launching uvicorn to the first successful /health response.
+#
+# Runs against a throwaway SQLite database unless DATABASE_URL is set, covering a cold
+# database (schema created), a restart with a current schema, and DB_SCHEMA_MODE=off.
+#
+# Usage: python benchmarks/startup_time.py [--runs 3]
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Starts the app and returns seconds until /health answers 200.
+def boot_once(env, timeout=60):
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("app did not become healthy in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+# Time to import app.main in a fresh interpreter.
+def import_time(env):
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main(runs):
+    base_env = dict(os.environ)
+    if "DATABASE_URL" not in base_env:
+        base_env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/startup.db"
+    results = {"import_app_main_ms": round(import_time(base_env) * 1000, 1)}
+    results["cold_schema_created_ms"] = round(boot_once(base_env) * 1000, 1)
+    cases = {"restart_schema_current": {}, "restart_schema_mode_off": {"DB_SCHEMA_MODE": "off"}}
+    for name, overrides in cases.items():
+        samples = [boot_once(dict(base_env, **overrides)) for _ in range(runs)]
+        results[f"{name}_ms"] = round(min(samples) * 1000, 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time from process start to first healthy /health")
+    parser.add_argument("--runs", type=int, default=3)
+    main(parser.parse_args().runs)
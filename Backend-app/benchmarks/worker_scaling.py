@@ -0,0 +1,158 @@
+# Measures how throughput scales with the number of gunicorn workers.
+#
+# For each worker count, starts the production server (app/gunicorn_conf.py) on a free port
+# against a throwaway SQLite database and drives it over real sockets from --load-procs
+# processes with keep-alive connections. Scenarios:
+#   products - GET /api/products/?limit=100 with the product cache off (database + JSON)
+#   login    - POST /api/auth/login (bcrypt; rounds from --bcrypt-rounds)
+# Throughput only scales up to the cores the machine (or the container's CPU quota) gives;
+# the report includes that count.
+#
+# Usage: python benchmarks/worker_scaling.py [--workers 1,2,4] [--scenario products] [--duration 10]
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+LOGIN = {"email": "scale@example.com", "password": "scale-password"}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def build_request(scenario):
+    if scenario == "login":
+        body = json.dumps(LOGIN).encode()
+        head = f"POST /api/auth/login HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        return head.encode() + body
+    return b"GET /api/products/?limit=100 HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+# One keep-alive connection sending requests back to back until the deadline.
+async def connection_loop(port, payload, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(payload)
+            status_line = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            status = int(status_line.split()[1])
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+def load_process(port, scenario, connections, duration, queue):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    async def run():
+        await asyncio.gather(*[connection_loop(port, build_request(scenario), deadline, latencies, statuses) for _ in range(connections)])
+    asyncio.run(run())
+    queue.put((latencies, statuses))
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+def post(port, path, body):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    try:
+        urllib.request.urlopen(request, timeout=30).read()
+    except urllib.error.HTTPError:
+        pass
+
+def seed(database_url):
+    os.environ["DATABASE_URL"] = database_url
+    from app import models
+    from app.db import engine, Base
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), [
+            {"name": f"Product {i}", "description": "Seeded for the scaling benchmark", "price": "9.99", "image_url": None} for i in range(1000)
+        ])
+
+def run_workers(workers, args, database_url):
+    from asgi_client import summarize
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}",
+               PRODUCT_CACHE_TTL="0", METRICS_SAMPLE_RATE="0", BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+               LOGIN_IP_PER_MINUTE="0", LOGIN_EMAIL_PER_MINUTE="0", ADMISSION_AUTH_CONCURRENCY="0", HASH_QUEUE_SIZE="100000")
+    env.setdefault("SECRET_KEY", "benchmark-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "python:app.gunicorn_conf", "app.main:app"],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        post(port, "/api/auth/register", LOGIN)
+        queue = multiprocessing.Queue()
+        per_process = max(1, args.connections // args.load_procs)
+        procs = [multiprocessing.Process(target=load_process, args=(port, args.scenario, per_process, args.duration, queue)) for _ in range(args.load_procs)]
+        for p in procs:
+            p.start()
+        latencies, statuses = [], {}
+        for _ in procs:
+            part, part_statuses = queue.get()
+            latencies += part
+            for status, count in part_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+        for p in procs:
+            p.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return {
+        "workers": workers,
+        "requests_per_sec": round(len(latencies) / args.duration, 1),
+        "latency": summarize(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+def main(args):
+    from app.cpu import available_cpus, cgroup_cpu_quota
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/scale.db"
+    seed(database_url)
+    results = [run_workers(int(n), args, database_url) for n in args.workers.split(",")]
+    single = results[0]["requests_per_sec"] or 1
+    for result in results:
+        result["speedup"] = round(result["requests_per_sec"] / single, 2)
+    print(json.dumps({
+        "scenario": args.scenario,
+        "available_cpus": available_cpus(),
+        "cgroup_cpu_quota": cgroup_cpu_quota(),
+        "connections": args.connections,
+        "results": results,
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput against the number of gunicorn workers")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--scenario", choices=("products", "login"), default="products")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--load-procs", type=int, default=2, help="load generator processes")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    main(parser.parse_args())